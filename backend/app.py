@@ -1,13 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, send_from_directory
 from flask_cors import CORS
 import os
+import time
 from werkzeug.utils import secure_filename
 from people_count import detect_and_count_people
-from counter import Counter, count_data
-from ultralytics import YOLO
+from counter import Counter, count_state, DEFAULT_ROI, DEFAULT_IMGSZ
+from inference_backend import load_detector, BACKENDS
+from roi import parse_roi
+import metrics
+import tracing
+import resources
+from stages import new_job_id, results_dir
+from video_export import EXPORT_FILENAME
+from job_queue import JobQueue
+from count_series import CountSeries
+from batch import ANALYZERS
+import fast_scan
+import detection_cache
 import threading
-from number_plate_detection import NumberPlateDetector, get_plate_data
-from mask_detection import MaskDetector, get_mask_data
+from number_plate_detection import NumberPlateDetector, plate_state, MIN_PLATE_CONFIDENCE, PLATE_FRAME_STEP
+from mask_detection import MaskDetector, mask_state
 
 app = Flask(__name__)
 CORS(app)
@@ -20,6 +32,19 @@ if not os.path.exists(UPLOAD_FOLDER):
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Longest time a long-poll request is held open, in seconds
+MAX_LONG_POLL = 60
+
+# Split the cores between concurrently running analyzer jobs
+if resources.CPU_BUDGET:
+    resources.install()
+
+# Durable queue of analysis jobs, processed by job_worker.py processes
+job_queue = JobQueue()
+
+# Crossing events and their 1s/1m/1h rollups
+count_series = CountSeries()
+
 # Global counter instance
 counter_instance = None
 processing_thread = None
@@ -32,9 +57,102 @@ plate_processing_thread = None
 mask_detector_instance = None
 mask_processing_thread = None
 
+class InvalidParameter(ValueError):
+    """A request parameter that cannot be parsed; answered with 400"""
+
+@app.errorhandler(InvalidParameter)
+def invalid_parameter(e):
+    return jsonify({'error': str(e)}), 400
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def number_param(values, name, default=None, cast=float, minimum=None):
+    """Read a number from request form or args, raising InvalidParameter when malformed"""
+    value = values.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise InvalidParameter(f"{name} must be {'an integer' if cast is int else 'a number'}")
+    if number != number or number in (float('inf'), float('-inf')):
+        raise InvalidParameter(f"{name} must be finite")
+    if minimum is not None and number < minimum:
+        raise InvalidParameter(f"{name} must be at least {minimum}")
+    return number
+
+def backend_option():
+    """Inference backend requested in the form (None for the default)"""
+    backend = request.form.get('backend') or None
+    if backend is not None and backend not in BACKENDS:
+        raise InvalidParameter(f"Unknown inference backend: {backend} (one of {', '.join(BACKENDS)})")
+    return backend
+
+def roi_options(default_roi=None, default_imgsz=640):
+    """Read the per-job ROI and inference size from the request form"""
+    roi = default_roi
+    if 'roi' in request.form:
+        margin = number_param(request.form, 'roi_margin', 0, int)
+        try:
+            roi = parse_roi(request.form['roi'], margin)
+        except (ValueError, TypeError, IndexError, KeyError) as e:
+            raise InvalidParameter(f"Invalid roi: {e}")
+    imgsz = number_param(request.form, 'imgsz', default_imgsz if roi is default_roi else 640, int, minimum=32)
+    return roi, imgsz
+
+def snapshot_response(store):
+    """
+    Serve a state snapshot with its epoch and version as ETag. Clients may send
+    If-None-Match to get 304 when unchanged, or ?wait=<etag or version> to
+    long-poll until a newer version is published (up to ?timeout= seconds).
+    Versions from another epoch (a restarted server) are answered at once.
+    """
+    if 'wait' in request.args:
+        epoch, _, wait = request.args['wait'].strip('"').rpartition('-')
+        wait = number_param({'wait': wait}, 'wait', cast=int, minimum=0)
+        if wait is None:
+            raise InvalidParameter('wait must be an integer')
+        timeout = min(number_param(request.args, 'timeout', 25, minimum=0), MAX_LONG_POLL)
+        if epoch in ('', store.epoch) and wait <= store.version:
+            store.wait(wait, timeout)
+    
+    version, body = store.json()
+    etag = f'"{store.epoch}-{version}"'
+    headers = {'ETag': etag, 'X-State-Version': str(version), 'X-State-Epoch': store.epoch,
+               'Cache-Control': 'no-cache'}
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype='application/json', headers=headers)
+
+def tracking_options():
+    """Read detect-then-track settings from the request form"""
+    options = {}
+    if request.form.get('detect_every'):
+        options['detect_every'] = number_param(request.form, 'detect_every', cast=int, minimum=1)
+    if request.form.get('scene_threshold'):
+        options['scene_threshold'] = number_param(request.form, 'scene_threshold', minimum=0)
+    return options
+
+def export_option():
+    """Whether the request asks for the annotated video to be exported"""
+    return request.form.get('export', '').lower() in ('1', 'true', 'yes')
+
+def started_response(instance, message):
+    """Response of the start endpoints, with the export URL when exporting"""
+    job_id = instance.stages.job_id
+    body = {'success': True, 'job_id': job_id, 'message': message}
+    if instance.export:
+        body['export_url'] = f'/api/results/{job_id}/{EXPORT_FILENAME}'
+    return jsonify(body)
+
+def trace_options(job_id):
+    """Start recording a trace of the job if the request asks for one"""
+    if request.form.get('trace', '').lower() not in ('1', 'true', 'yes'):
+        return
+    sample_ms = number_param(request.form, 'trace_sample_ms', minimum=0)
+    tracing.trace_job(job_id, sample_ms / 1000 if sample_ms else None)
+
 @app.route('/api/detect-people', methods=['POST'])
 def detect_people():
     if 'video' not in request.files:
@@ -50,21 +168,25 @@ def detect_people():
         file.save(filepath)
         
         try:
+            job_id = new_job_id()
+            trace_options(job_id)
+            
             # Process the video and get results
-            results = detect_and_count_people(filepath)
+            results = detect_and_count_people(filepath, backend_option(), job_id)
             
             # Clean up the uploaded file
             os.remove(filepath)
             
             return jsonify({
                 'success': True,
+                'job_id': job_id,
                 'results': results
             })
         except Exception as e:
             # Clean up the uploaded file in case of error
             if os.path.exists(filepath):
                 os.remove(filepath)
-            return jsonify({'error': str(e)}), 500
+            return jsonify({'error': str(e)}), 400 if isinstance(e, InvalidParameter) else 500
     
     return jsonify({'error': 'Invalid file type'}), 400
 
@@ -90,66 +212,55 @@ def start_counting():
         file.save(filepath)
         
         try:
+            roi, imgsz = roi_options(DEFAULT_ROI, DEFAULT_IMGSZ)
+            
             # Initialize YOLO model
-            model = YOLO('yolov8n.pt')
+            model = load_detector('yolov8n.pt', backend_option(), imgsz=imgsz)
             
             # Create counter instance
-            counter_instance = Counter(filepath, model)
+            recorded_at = number_param(request.form, 'recorded_at')
+            counter_instance = Counter(filepath, model, roi=roi, export=export_option(),
+                                       series=count_series, source=request.form.get('source', 'default'),
+                                       recorded_at=recorded_at,
+                                       **tracking_options())
+            trace_options(counter_instance.stages.job_id)
             
             # Start processing in background
             processing_thread = counter_instance.start_processing()
             
-            return jsonify({
-                'success': True,
-                'message': 'People counting started'
-            })
+            return started_response(counter_instance, 'People counting started')
         except Exception as e:
             # Clean up the uploaded file in case of error
             if os.path.exists(filepath):
                 os.remove(filepath)
-            return jsonify({'error': str(e)}), 500
+            return jsonify({'error': str(e)}), 400 if isinstance(e, InvalidParameter) else 500
     
     return jsonify({'error': 'Invalid file type'}), 400
 
 @app.route('/api/count-data', methods=['GET'])
 def get_count_data():
     """Return current count data as JSON"""
+    return snapshot_response(count_state)
+
+@app.route('/api/counts/range', methods=['GET'])
+def get_count_range():
+    """
+    Entering/exiting counts of a source between ?start= and ?end= (epoch seconds,
+    end defaults to now) from the rollups; ?resolution=1s|1m|1h, default picks one
+    """
+    end = number_param(request.args, 'end', time.time())
+    start = number_param(request.args, 'start', end - 3600)
+    if end <= start:
+        return jsonify({'error': 'end must be after start'}), 400
     try:
-        # Create a copy of count_data to modify
-        data = dict(count_data)
-        
-        # Handle frame_base64 data safely
-        frame_base64 = None
-        if data.get('frame_base64') is not None:
-            try:
-                # Use base64 encoding for better browser compatibility
-                import base64
-                frame_base64 = base64.b64encode(data['frame_base64']).decode('utf-8')
-            except (AttributeError, UnicodeDecodeError) as e:
-                print(f"Error encoding frame_base64: {e}")
-                # If encoding fails, try the old method
-                try:
-                    frame_base64 = data['frame_base64'].decode('latin1')
-                except Exception:
-                    # If all fails, just return the raw bytes
-                    if isinstance(data['frame_base64'], bytes):
-                        frame_base64 = data['frame_base64']
-        
-        # Update the frame_base64 in the data copy
-        data['frame_base64'] = frame_base64
-        
-        return jsonify(data)
-    except Exception as e:
-        print(f"Error in get_count_data: {e}")
-        # Return a safe default response
-        return jsonify({
-            'entering': 0,
-            'exiting': 0,
-            'last_updated': time.time(),
-            'processing_complete': False,
-            'frame_base64': None,
-            'error': str(e)
-        })
+        return jsonify(count_series.range(request.args.get('source', 'default'), start, end,
+                                          request.args.get('resolution')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/counts/sources', methods=['GET'])
+def get_count_sources():
+    return jsonify({'sources': count_series.sources()})
 
 @app.route('/api/start-plate-detection', methods=['POST'])
 def start_plate_detection():
@@ -173,31 +284,33 @@ def start_plate_detection():
         file.save(filepath)
         
         try:
-            # Initialize YOLO model
-            model = YOLO('yolov8n.pt')
+            roi, imgsz = roi_options()
             
             # Create plate detector instance
-            plate_detector_instance = NumberPlateDetector(filepath, model_path='yolov8n.pt')
+            plate_detector_instance = NumberPlateDetector(filepath, model_path='yolov8n.pt',
+                                                          backend=backend_option(),
+                                                          roi=roi, imgsz=imgsz, export=export_option(),
+                                                          frame_step=number_param(request.form, 'frame_step',
+                                                                                  PLATE_FRAME_STEP, int, minimum=1),
+                                                          **tracking_options())
+            trace_options(plate_detector_instance.stages.job_id)
             
             # Start processing in background
             plate_processing_thread = plate_detector_instance.start_processing()
             
-            return jsonify({
-                'success': True,
-                'message': 'License plate detection started'
-            })
+            return started_response(plate_detector_instance, 'License plate detection started')
         except Exception as e:
             # Clean up the uploaded file in case of error
             if os.path.exists(filepath):
                 os.remove(filepath)
-            return jsonify({'error': str(e)}), 500
+            return jsonify({'error': str(e)}), 400 if isinstance(e, InvalidParameter) else 500
     
     return jsonify({'error': 'Invalid file type'}), 400
 
 @app.route('/api/plate-data', methods=['GET'])
 def get_license_plate_data():
     """Return current license plate data as JSON"""
-    return jsonify(get_plate_data())
+    return snapshot_response(plate_state)
 
 @app.route('/api/stop-plate-detection', methods=['POST'])
 def stop_plate_detection():
@@ -231,28 +344,31 @@ def start_mask_detection():
         file.save(filepath)
         
         try:
+            roi, imgsz = roi_options()
+            
             # Create mask detector instance
-            mask_detector_instance = MaskDetector(filepath, model_path='yolov8n.pt')
+            mask_detector_instance = MaskDetector(filepath, model_path='yolov8n.pt',
+                                                  backend=backend_option(),
+                                                  roi=roi, imgsz=imgsz, export=export_option(),
+                                                  **tracking_options())
+            trace_options(mask_detector_instance.stages.job_id)
             
             # Start processing in background
             mask_processing_thread = mask_detector_instance.start_processing()
             
-            return jsonify({
-                'success': True,
-                'message': 'Mask detection started'
-            })
+            return started_response(mask_detector_instance, 'Mask detection started')
         except Exception as e:
             # Clean up the uploaded file in case of error
             if os.path.exists(filepath):
                 os.remove(filepath)
-            return jsonify({'error': str(e)}), 500
+            return jsonify({'error': str(e)}), 400 if isinstance(e, InvalidParameter) else 500
     
     return jsonify({'error': 'Invalid file type'}), 400
 
 @app.route('/api/mask-data', methods=['GET'])
 def get_mask_detection_data():
     """Return current mask detection data as JSON"""
-    return jsonify(get_mask_data())
+    return snapshot_response(mask_state)
 
 @app.route('/api/stop-mask-detection', methods=['POST'])
 def stop_mask_detection():
@@ -264,6 +380,163 @@ def stop_mask_detection():
     
     return jsonify({'success': False, 'message': 'No active mask detection to stop'})
 
+@app.route('/api/jobs', methods=['POST'])
+def enqueue_job():
+    """Queue a video for analysis by the job workers"""
+    if 'video' not in request.files:
+        return jsonify({'error': 'No video file provided'}), 400
+    
+    analyzer = request.form.get('analyzer', 'counter')
+    if analyzer not in ANALYZERS:
+        return jsonify({'error': f'Unknown analyzer: {analyzer}'}), 400
+    
+    file = request.files['video']
+    if file.filename == '' or not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    priority = number_param(request.form, 'priority', 0, int)
+    backend = backend_option()
+    
+    # The upload folder must be reachable by every worker
+    job_id = new_job_id()
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{secure_filename(file.filename)}")
+    file.save(filepath)
+    
+    options = {'cleanup': True}
+    if backend:
+        options['backend'] = backend
+    job_queue.enqueue(analyzer, os.path.abspath(filepath), options,
+                      priority=priority, job_id=job_id)
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
+@app.route('/api/fast-scan', methods=['POST'])
+def fast_scan_video():
+    """
+    Approximate activity report of an uploaded video. With queue=1 the video is
+    kept and full runs over its active segments are queued as jobs.
+    """
+    if 'video' not in request.files:
+        return jsonify({'error': 'No video file provided'}), 400
+    
+    analyzer = request.form.get('analyzer', 'counter')
+    if analyzer not in ANALYZERS:
+        return jsonify({'error': f'Unknown analyzer: {analyzer}'}), 400
+    
+    file = request.files['video']
+    if file.filename == '' or not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    
+    segment_seconds = number_param(request.form, 'segment_seconds', fast_scan.SEGMENT_SECONDS, minimum=1)
+    sample_every = number_param(request.form, 'sample_every', minimum=0.01)
+    backend = backend_option()
+    
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{new_job_id()}_{secure_filename(file.filename)}")
+    file.save(filepath)
+    queue_full = request.form.get('queue', '').lower() in ('1', 'true', 'yes')
+    report = {}
+    
+    try:
+        report = fast_scan.scan(filepath, analyzer, segment_seconds, sample_every,
+                                backend=backend)
+        if queue_full:
+            # The queue deletes the upload once the last of these jobs is done
+            report['queued_jobs'] = fast_scan.queue_full_runs(job_queue, report, backend,
+                                                              cleanup=True)
+        report['video'] = file.filename
+        return jsonify(report)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        # Queued jobs read the upload, so it is only kept when jobs were queued
+        if not (queue_full and report.get('queued_jobs')) and os.path.exists(filepath):
+            os.remove(filepath)
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """Recent jobs, optionally filtered by ?status="""
+    limit = min(number_param(request.args, 'limit', 100, int, minimum=1), 1000)
+    return jsonify({
+        'counts': job_queue.counts(),
+        'jobs': job_queue.jobs(request.args.get('status'), limit)
+    })
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status, attempts and result of a queued job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/api/reanalyze/<job_id>', methods=['POST'])
+def reanalyze(job_id):
+    """
+    Re-run counting or filtering of a finished job from its detection cache.
+    Counter jobs take JSON {"areas": [area1, area2], "classes": [...]}, plate
+    jobs {"min_confidence": 0.3}. Only counter and plate runs are cached.
+    """
+    params = request.get_json(silent=True)
+    if params is None:
+        params = {}
+    elif not isinstance(params, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    job = job_queue.get(job_id)
+    if job is not None and job['analyzer'] not in detection_cache.REPLAY_ANALYZERS:
+        return jsonify({'error': f"Re-analysis is not supported for {job['analyzer']} jobs"}), 400
+    try:
+        cache = detection_cache.load_cache(secure_filename(job_id))
+    except FileNotFoundError:
+        return jsonify({'error': 'No detection cache for this job (only counter and plate runs are cached)'}), 404
+    
+    start = time.time()
+    analyzer = cache.meta['analyzer']
+    if analyzer == 'counter':
+        try:
+            results = detection_cache.replay_counter(cache, params.get('areas'), params.get('classes'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    elif analyzer == 'plate':
+        results = detection_cache.replay_plates(cache, number_param(params, 'min_confidence',
+                                                                    MIN_PLATE_CONFIDENCE, minimum=0))
+    else:
+        return jsonify({'error': f'Re-analysis is not supported for {analyzer} jobs'}), 400
+    
+    return jsonify({
+        'job_id': job_id,
+        'analyzer': analyzer,
+        'results': results,
+        'seconds': time.time() - start
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Return process metrics in the Prometheus text format"""
+    metrics.queue_depth.set(job_queue.counts().get('queued', 0), 'jobs')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/trace/<job_id>', methods=['GET'])
+def get_trace(job_id):
+    """Download the recorded trace of a job"""
+    path = tracing.trace_path(secure_filename(job_id))
+    if not os.path.exists(path):
+        return jsonify({'error': 'No trace recorded for this job'}), 404
+    return send_from_directory(os.path.abspath(os.path.dirname(path)), 'trace.json', as_attachment=True)
+
+@app.route('/api/results/<job_id>/<path:filename>', methods=['GET'])
+def get_result_file(job_id, filename):
+    """Serve a file from a job's results directory (e.g. the exported video)"""
+    directory = os.path.abspath(results_dir(secure_filename(job_id), create=False))
+    if not os.path.isdir(directory):
+        return jsonify({'error': 'Unknown job'}), 404
+    return send_from_directory(directory, filename)
+
+@app.route('/api/resources', methods=['GET'])
+def get_resources():
+    """Core budgets of the running jobs"""
+    manager = resources.get_manager()
+    if manager is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(manager.snapshot(), enabled=True))
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy'})
@@ -0,0 +1,201 @@
+"""
+Headless batch processing of recordings.
+
+Runs the selected analyzers over a directory or glob of videos in parallel
+worker processes, without the web server. Each worker loads a model once and
+reuses it for every file it processes. Results are written per file as JSON
+and CSV (plates also as <file>_plates.xlsx), plus a summary.json for the whole
+batch.
+
+    python batch.py /archive/2024-05 --analyzers counter,plate --workers 4 --output results
+    python batch.py "/archive/**/*.mp4" --workers 8
+"""
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+ANALYZERS = ('counter', 'mask', 'plate', 'people')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+def find_videos(source):
+    """Videos in a directory (recursively) or matching a glob, largest first"""
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, '**', '*'), recursive=True)
+    else:
+        paths = glob.glob(source, recursive=True)
+    paths = [p for p in paths if os.path.isfile(p) and p.lower().endswith(VIDEO_EXTENSIONS)]
+    # Start the longest files first so one big file does not finish the batch alone
+    return sorted(paths, key=os.path.getsize, reverse=True)
+
+def _init_worker(threads):
+    """Split the CPU between the worker processes"""
+    import cv2
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+
+def analyze(name, video_path, output_dir, backend=None, job_id=None, start=None, end=None, stem=None,
+            cache_detections=True):
+    """
+    Run one analyzer over a video (or its start-end seconds) without previews
+    and return its results. Detectors come from load_detector, so they are
+    loaded once per process. Files written to output_dir are named after stem
+    (default: the video's file name), since workers share the directory.
+    cache_detections keeps the per-job detection cache for re-analysis.
+    """
+    from inference_backend import load_detector
+    if name == 'counter':
+        from counter import Counter, DEFAULT_IMGSZ
+        counter = Counter(video_path, load_detector('yolov8n.pt', backend, imgsz=DEFAULT_IMGSZ),
+                          preview=False, cleanup=False, start=start, end=end,
+                          cache_detections=cache_detections)
+        if job_id:
+            counter.stages.job_id = job_id
+        counter.readVideo()
+        return {'entering': counter.entering, 'exiting': counter.exiting,
+                'frames': counter.stages.frame, 'job_id': counter.stages.job_id}
+    if name == 'mask':
+        from mask_detection import MaskDetector
+        detector = MaskDetector(video_path, backend=backend, preview=False, start=start, end=end)
+        if job_id:
+            detector.stages.job_id = job_id
+        detector.is_running = True
+        detector.process_video()
+        return {'frames': detector.frames_processed, 'with_mask': detector.with_mask,
+                'without_mask': detector.without_mask, 'job_id': detector.stages.job_id}
+    if name == 'plate':
+        from number_plate_detection import NumberPlateDetector
+        detector = NumberPlateDetector(video_path, backend=backend, preview=False, start=start, end=end,
+                                       cache_detections=cache_detections)
+        if job_id:
+            detector.stages.job_id = job_id
+        stem = stem or os.path.splitext(os.path.basename(video_path))[0]
+        detector.excel_path = os.path.join(output_dir, f"{stem}_plates.xlsx")
+        detector.plate_dir = os.path.join(output_dir, f"{stem}_plates")
+        detector.process_video()
+        return {'plates': [{'text': p['text'], 'confidence': p['confidence'], 'timestamp': p['timestamp']}
+                           for p in detector.plates],
+                'detections': detector.plate_store.detections,
+                'detections_csv': detector.plate_store.log_path,
+                'job_id': detector.stages.job_id}
+    if name == 'people':
+        from people_count import detect_and_count_people
+        # Not shared: the tracker state lives on the model
+        return detect_and_count_people(video_path, backend, job_id, start, end)
+    raise ValueError(f"Unknown analyzer: {name}")
+
+def run_task(name, video_path, output_dir, source, backend=None):
+    """Worker entry point; never raises so one bad file does not stop the batch"""
+    start = time.time()
+    try:
+        # Nothing re-analyzes batch runs, so no detection cache is kept
+        results = analyze(name, video_path, output_dir, backend, stem=output_stem(video_path, source),
+                          cache_detections=False)
+        error = None
+    except Exception as e:
+        traceback.print_exc()
+        results, error = None, f"{type(e).__name__}: {e}"
+    return {'analyzer': name, 'video': video_path, 'results': results,
+            'error': error, 'seconds': time.time() - start}
+
+def output_stem(video_path, source):
+    """Output file name for a video, keeping its path below the source directory"""
+    base = source if os.path.isdir(source) else os.path.dirname(source.split('*')[0]) or '.'
+    relative = os.path.relpath(video_path, base)
+    return os.path.splitext(relative.replace(os.sep, '__'))[0]
+
+def write_file_results(output_dir, stem, video_path, tasks):
+    """Write <stem>.json with every analyzer's results and <stem>.csv with the scalar values"""
+    report = {'video': video_path, 'analyzers': {t['analyzer']: t for t in tasks}}
+    with open(os.path.join(output_dir, f"{stem}.json"), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    with open(os.path.join(output_dir, f"{stem}.csv"), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['analyzer', 'metric', 'value'])
+        for t in tasks:
+            if t['error']:
+                writer.writerow([t['analyzer'], 'error', t['error']])
+                continue
+            for key, value in t['results'].items():
+                if isinstance(value, (int, float, str)):
+                    writer.writerow([t['analyzer'], key, value])
+
+    # Keep the full plate detection log next to the per-file results
+    for t in tasks:
+        if t['analyzer'] == 'plate' and t['results'] and os.path.exists(t['results']['detections_csv']):
+            shutil.copyfile(t['results']['detections_csv'], os.path.join(output_dir, f"{stem}_plates.csv"))
+
+def run_batch(videos, analyzers, output_dir, workers, source, backend=None):
+    """Process every (video, analyzer) pair across worker processes; return the summary"""
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    pending = {video: len(analyzers) for video in videos}
+    done = {video: [] for video in videos}
+    summary = {'started': time.time(), 'workers': workers, 'analyzers': list(analyzers), 'files': []}
+
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(threads,)) as pool:
+        futures = [pool.submit(run_task, name, video, output_dir, source, backend)
+                   for video in videos for name in analyzers]
+        for future in as_completed(futures):
+            task = future.result()
+            video = task['video']
+            done[video].append(task)
+            pending[video] -= 1
+            status = 'failed' if task['error'] else 'done'
+            print(f"[{status}] {task['analyzer']} {video} ({task['seconds']:.1f}s)")
+            if pending[video]:
+                continue
+
+            stem = output_stem(video, source)
+            write_file_results(output_dir, stem, video, done[video])
+            summary['files'].append({
+                'video': video,
+                'output': f"{stem}.json",
+                'seconds': sum(t['seconds'] for t in done[video]),
+                'errors': {t['analyzer']: t['error'] for t in done[video] if t['error']}
+            })
+
+    summary['finished'] = time.time()
+    summary['failed'] = sum(1 for f in summary['files'] if f['errors'])
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the Sentinel analyzers over a batch of recordings')
+    parser.add_argument('source', help='directory of recordings or a glob pattern')
+    parser.add_argument('--analyzers', default='counter', help=f"comma separated, from {','.join(ANALYZERS)}")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument('--output', default='batch_results')
+    parser.add_argument('--backend', help='inference backend (torch, onnx, openvino)')
+    args = parser.parse_args()
+
+    analyzers = args.analyzers.split(',')
+    for name in analyzers:
+        if name not in ANALYZERS:
+            parser.error(f"Unknown analyzer: {name}")
+
+    videos = find_videos(args.source)
+    if not videos:
+        print(f"No videos found in {args.source}", file=sys.stderr)
+        return 1
+
+    print(f"Processing {len(videos)} videos with {args.workers} workers")
+    summary = run_batch(videos, analyzers, args.output, max(1, args.workers), args.source, args.backend)
+    print(f"Finished {len(summary['files'])} videos, {summary['failed']} with errors")
+    return 1 if summary['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
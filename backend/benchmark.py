@@ -0,0 +1,315 @@
+"""
+Stage-level benchmark for the analyzers.
+
+Runs Counter, MaskDetector, NumberPlateDetector and detect_and_count_people
+over the bundled sample video and synthetic clips and reports throughput,
+per-frame and per-stage latency percentiles and peak RSS as JSON.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.1
+    python benchmark.py --analyzers counter,plate,mask --concurrent
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+import cv2
+import numpy as np
+import stages
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is reported as null there
+    resource = None
+
+ANALYZERS = ('counter', 'mask', 'plate', 'people')
+SAMPLE_VIDEOS = [os.path.join('..', 'mask.mp4'), os.path.join('uploads', 'mask.mp4')]
+SYNTHETIC_CLIPS = {
+    'synthetic_720p': (1280, 720),
+    'synthetic_1080p': (1920, 1080)
+}
+PERCENTILES = (50, 95, 99)
+
+def peak_rss_mb():
+    """Peak resident memory of this process (ru_maxrss is in kilobytes on Linux)"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class StageRecorder:
+    """Stage listener that keeps every stage duration and per-frame span"""
+    def __init__(self):
+        self.stages = defaultdict(list)
+        self.frames = {}
+
+    def __call__(self, timer, stage, start, end):
+        self.stages[stage].append(end - start)
+        key = (id(timer), timer.frame)
+        span = self.frames.get(key)
+        if span is None:
+            self.frames[key] = [start, end]
+        else:
+            span[0] = min(span[0], start)
+            span[1] = max(span[1], end)
+
+def percentiles_ms(values):
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    values = np.array(values) * 1000
+    return {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+
+def find_sample_video():
+    for path in SAMPLE_VIDEOS:
+        if os.path.exists(path):
+            return path
+    return None
+
+def make_synthetic_clip(path, size, frames=150, fps=25):
+    """Write a clip of textured background with moving blobs"""
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (31, 31), 0)
+    blobs = [(rng.integers(0, width), rng.integers(0, height), rng.integers(-12, 12), rng.integers(-6, 6))
+             for _ in range(8)]
+    bw, bh = width // 20, height // 6
+    for i in range(frames):
+        frame = background.copy()
+        for x, y, dx, dy in blobs:
+            cx = int(x + dx * i) % width
+            cy = int(y + dy * i) % height
+            cv2.rectangle(frame, (cx, cy), (cx + bw, cy + bh), (40, 40, 40), -1)
+            cv2.circle(frame, (cx + bw // 2, cy - bw // 2), bw // 2, (60, 80, 120), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+def copy_clip(src, dst, max_frames):
+    """Copy at most max_frames frames of a clip (analyzers may delete their input)"""
+    cap = cv2.VideoCapture(src)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    writer = cv2.VideoWriter(dst, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    count = 0
+    while count < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        writer.write(frame)
+        count += 1
+    cap.release()
+    writer.release()
+    return count
+
+def run_analyzer(name, video_path, workdir):
+    if name == 'counter':
+        from counter import Counter, DEFAULT_IMGSZ
+        from inference_backend import load_detector
+        Counter(video_path, load_detector('yolov8n.pt', imgsz=DEFAULT_IMGSZ)).readVideo()
+    elif name == 'mask':
+        from mask_detection import MaskDetector
+        detector = MaskDetector(video_path)
+        detector.is_running = True
+        detector.process_video()
+    elif name == 'plate':
+        from number_plate_detection import NumberPlateDetector
+        detector = NumberPlateDetector(video_path)
+        detector.excel_path = os.path.join(workdir, 'license_plates.xlsx')
+        detector.process_video()
+    elif name == 'people':
+        from people_count import detect_and_count_people
+        detect_and_count_people(video_path)
+    else:
+        raise ValueError(f"Unknown analyzer: {name}")
+
+def run_case(analyzer, clip_name, clip_path, max_frames):
+    """Benchmark one analyzer on one clip and return its report"""
+    workdir = tempfile.mkdtemp(prefix='sentinel-bench-')
+    try:
+        video = os.path.join(workdir, 'clip.mp4')
+        frames = copy_clip(clip_path, video, max_frames)
+
+        recorder = StageRecorder()
+        stages.add_listener(recorder)
+        start = time.perf_counter()
+        try:
+            run_analyzer(analyzer, video, workdir)
+        finally:
+            wall = time.perf_counter() - start
+            stages.remove_listener(recorder)
+
+        frame_spans = [end - begin for begin, end in recorder.frames.values()]
+        return {
+            'analyzer': analyzer,
+            'clip': clip_name,
+            'frames': frames,
+            'wall_s': wall,
+            'fps': frames / wall if wall > 0 else None,
+            'frame_latency_ms': percentiles_ms(frame_spans),
+            'stages': {
+                stage: dict(count=len(durations), total_ms=float(sum(durations) * 1000),
+                            **percentiles_ms(durations))
+                for stage, durations in recorder.stages.items()
+            },
+            'peak_rss_mb': peak_rss_mb()
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_concurrent_case(analyzers, clip_name, clip_path, max_frames, managed):
+    """Run several analyzers on one clip at once, optionally under the ResourceManager"""
+    import threading
+    import resources
+    workdir = tempfile.mkdtemp(prefix='sentinel-bench-')
+    try:
+        videos = {}
+        for name in analyzers:
+            videos[name] = os.path.join(workdir, f"{name}.mp4")
+            frames = copy_clip(clip_path, videos[name], max_frames)
+
+        if managed:
+            resources.install()
+        threads = [threading.Thread(target=run_analyzer, args=(name, videos[name], workdir)) for name in analyzers]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+        if managed:
+            resources.uninstall()
+
+        return {
+            'analyzer': '+'.join(analyzers) + (' (managed)' if managed else ''),
+            'clip': clip_name,
+            'frames': frames * len(analyzers),
+            'wall_s': wall,
+            'fps': frames * len(analyzers) / wall if wall > 0 else None,
+            'frame_latency_ms': percentiles_ms([]),
+            'stages': {},
+            'peak_rss_mb': peak_rss_mb()
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_isolated(*args, target=run_case):
+    """Run a case in a fresh interpreter so peak RSS is per case"""
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(1) as pool:
+        return pool.apply(target, args)
+
+def compare(results, baseline, tolerance):
+    """Return the regressions of results against a baseline report"""
+    previous = {(r['analyzer'], r['clip']): r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        base = previous.get((r['analyzer'], r['clip']))
+        if base is None:
+            continue
+        checks = [
+            ('fps', r['fps'], base['fps'], False),
+            ('frame_p95_ms', r['frame_latency_ms']['p95'], base['frame_latency_ms']['p95'], True),
+            ('peak_rss_mb', r['peak_rss_mb'], base['peak_rss_mb'], True)
+        ]
+        for stage, stats in r['stages'].items():
+            if stage in base['stages']:
+                checks.append((f"{stage}_p95_ms", stats['p95'], base['stages'][stage]['p95'], True))
+        for metric, value, old, higher_is_worse in checks:
+            if value is None or not old:
+                continue
+            change = (value - old) / old
+            if (change > tolerance) if higher_is_worse else (change < -tolerance):
+                regressions.append({
+                    'analyzer': r['analyzer'],
+                    'clip': r['clip'],
+                    'metric': metric,
+                    'baseline': old,
+                    'current': value,
+                    'change': change
+                })
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Sentinel analyzers')
+    parser.add_argument('--analyzers', default=','.join(ANALYZERS))
+    parser.add_argument('--clips', default='sample,' + ','.join(SYNTHETIC_CLIPS))
+    parser.add_argument('--frames', type=int, default=150, help='frames per clip')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed relative regression')
+    parser.add_argument('--no-isolate', action='store_true', help='run all cases in this process')
+    parser.add_argument('--concurrent', action='store_true',
+                        help='also run the analyzers together, with and without CPU budgets')
+    args = parser.parse_args()
+
+    clip_dir = tempfile.mkdtemp(prefix='sentinel-clips-')
+    try:
+        clips = {}
+        for name in args.clips.split(','):
+            if name == 'sample':
+                path = find_sample_video()
+                if path is None:
+                    print('Sample video not found, skipping', file=sys.stderr)
+                    continue
+                clips[name] = path
+            elif name in SYNTHETIC_CLIPS:
+                clips[name] = make_synthetic_clip(os.path.join(clip_dir, f"{name}.mp4"),
+                                                  SYNTHETIC_CLIPS[name], args.frames)
+            else:
+                parser.error(f"Unknown clip: {name}")
+
+        runner = run_case if args.no_isolate else run_isolated
+        results = []
+        for analyzer in args.analyzers.split(','):
+            for clip_name, clip_path in clips.items():
+                print(f"Benchmarking {analyzer} on {clip_name}", file=sys.stderr)
+                results.append(runner(analyzer, clip_name, clip_path, args.frames))
+        if args.concurrent:
+            analyzers = args.analyzers.split(',')
+            for clip_name, clip_path in clips.items():
+                for managed in (False, True):
+                    print(f"Benchmarking {'+'.join(analyzers)} together on {clip_name}"
+                          f"{' with CPU budgets' if managed else ''}", file=sys.stderr)
+                    case = (analyzers, clip_name, clip_path, args.frames, managed)
+                    if args.no_isolate:
+                        results.append(run_concurrent_case(*case))
+                    else:
+                        results.append(run_isolated(*case, target=run_concurrent_case))
+    finally:
+        shutil.rmtree(clip_dir, ignore_errors=True)
+
+    report = {
+        'created': time.time(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'results': results
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(results, json.load(f), args.tolerance)
+        for r in report['regressions']:
+            print(f"REGRESSION {r['analyzer']}/{r['clip']} {r['metric']}: "
+                  f"{r['baseline']:.2f} -> {r['current']:.2f} ({r['change']:+.0%})", file=sys.stderr)
+        status = 1 if report['regressions'] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Time series of people-counter crossings.
+
+Every crossing is stored as a raw event and added to pre-aggregated rollup
+tables at 1 s, 1 min and 1 h resolution, so range queries for dashboards read
+at most a few thousand rollup rows instead of scanning events or reprocessing
+video. Events are buffered and written in one transaction per flush, at the
+latest FLUSH_SECONDS after the first pending one; queries flush first.
+"""
+import os
+import sqlite3
+import threading
+
+COUNT_DB = os.environ.get('SENTINEL_COUNT_DB', os.path.join('uploads', 'counts.db'))
+
+ENTERING = 1
+EXITING = 2
+
+# Bucket width in seconds of each rollup table
+RESOLUTIONS = {'1s': 1, '1m': 60, '1h': 3600}
+
+# Range queries pick the finest resolution returning at most this many buckets
+MAX_POINTS = 1500
+
+# Buffered events are written once this many are pending
+FLUSH_EVENTS = 64
+
+# ... or at the latest this many seconds after the first of them came in
+FLUSH_SECONDS = 1.0
+
+def _schema():
+    tables = ["""
+    CREATE TABLE IF NOT EXISTS events (
+        source TEXT NOT NULL,
+        ts REAL NOT NULL,
+        direction INTEGER NOT NULL,
+        track INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS events_source_ts ON events (source, ts);
+    """]
+    for name in RESOLUTIONS:
+        tables.append(f"""
+    CREATE TABLE IF NOT EXISTS rollup_{name} (
+        source TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        entering INTEGER NOT NULL DEFAULT 0,
+        exiting INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (source, bucket)
+    ) WITHOUT ROWID;
+    """)
+    return ''.join(tables)
+
+class CountSeries:
+    """Crossing events plus 1s/1m/1h rollups in SQLite"""
+    def __init__(self, path=COUNT_DB):
+        self.path = path
+        self.pending = []
+        self.timer = None
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        db = self._connect()
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(_schema())
+        finally:
+            db.close()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute('PRAGMA busy_timeout=30000')
+        return db
+
+    def record(self, source, timestamp, direction, track=None):
+        """Buffer a crossing at timestamp (epoch seconds)"""
+        with self.lock:
+            self.pending.append((source, float(timestamp), direction, track))
+            full = len(self.pending) >= FLUSH_EVENTS
+            if not full and self.timer is None:
+                self.timer = threading.Timer(FLUSH_SECONDS, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write buffered events and add them to the rollups"""
+        with self.lock:
+            events, self.pending = self.pending, []
+            timer, self.timer = self.timer, None
+        if timer is not None:
+            timer.cancel()
+        if not events:
+            return
+
+        # Pre-aggregate the batch per bucket before touching the tables
+        rollups = {name: {} for name in RESOLUTIONS}
+        for source, ts, direction, _ in events:
+            for name, width in RESOLUTIONS.items():
+                key = (source, int(ts // width) * width)
+                entering, exiting = rollups[name].get(key, (0, 0))
+                if direction == ENTERING:
+                    entering += 1
+                else:
+                    exiting += 1
+                rollups[name][key] = (entering, exiting)
+
+        db = self._connect()
+        try:
+            with db:
+                db.executemany("INSERT INTO events (source, ts, direction, track) VALUES (?, ?, ?, ?)", events)
+                for name, buckets in rollups.items():
+                    db.executemany(
+                        f"INSERT INTO rollup_{name} (source, bucket, entering, exiting) VALUES (?, ?, ?, ?)"
+                        " ON CONFLICT (source, bucket) DO UPDATE SET"
+                        " entering = entering + excluded.entering, exiting = exiting + excluded.exiting",
+                        [(source, bucket, e, x) for (source, bucket), (e, x) in buckets.items()])
+        finally:
+            db.close()
+
+    def pick_resolution(self, start, end):
+        for name, width in RESOLUTIONS.items():
+            if (end - start) / width <= MAX_POINTS:
+                return name
+        return '1h'
+
+    def range(self, source, start, end, resolution=None):
+        """
+        Buckets of [start, end) for a source as {'t', 'entering', 'exiting', 'net'}
+        where net is the running entering - exiting from start, plus totals.
+        """
+        resolution = resolution or self.pick_resolution(start, end)
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        width = RESOLUTIONS[resolution]
+        self.flush()
+        db = self._connect()
+        try:
+            rows = db.execute(
+                f"SELECT bucket, entering, exiting FROM rollup_{resolution}"
+                " WHERE source = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                (source, int(start // width) * width, end)).fetchall()
+        finally:
+            db.close()
+
+        buckets = []
+        net = entering_total = exiting_total = 0
+        for bucket, entering, exiting in rows:
+            net += entering - exiting
+            entering_total += entering
+            exiting_total += exiting
+            buckets.append({'t': bucket, 'entering': entering, 'exiting': exiting, 'net': net})
+        return {
+            'source': source,
+            'start': start,
+            'end': end,
+            'resolution': resolution,
+            'entering': entering_total,
+            'exiting': exiting_total,
+            'buckets': buckets
+        }
+
+    def sources(self):
+        self.flush()
+        db = self._connect()
+        try:
+            return [row[0] for row in db.execute("SELECT DISTINCT source FROM rollup_1h")]
+        finally:
+            db.close()
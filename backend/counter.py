@@ -1,9 +1,18 @@
 import os
+import base64
 import numpy as np
 import cv2 as cv
 from showClassInModel import showDatainFile
 from tracker import *
-import pandas as pd
+from roi import ROI
+from propagation import DetectThenTrack
+from video_decoder import open_video
+from video_export import open_export
+from stages import StageTimer
+from snapshots import SnapshotStore
+from track_store import TrackStore
+from count_series import ENTERING, EXITING
+from detection_cache import DetectionCacheWriter, cache_dir
 import threading
 import time
 
@@ -11,14 +20,106 @@ area1=[(312,388),(289,390),(474,469),(497,462)]
 
 area2=[(279,392),(250,397),(423,477),(454,469)]
 
-# Global count variables for access from other modules
-count_data = {
+# Frames are resized to this size before detection
+FRAME_SIZE=(1020,500)
+
+# Detection only needs to see people near the door zones. The margin reaches
+# further up so a whole person standing in the zones stays inside the crop.
+ZONE_MARGIN=(60,220,60,20)
+DEFAULT_ROI=ROI.from_zones([area1,area2],ZONE_MARGIN).clip(*FRAME_SIZE)
+
+# Per-track zone flags
+IN_AREA2=1
+IN_AREA1=2
+COUNTED_ENTERING=4
+COUNTED_EXITING=8
+
+# Track state is dropped once a track has not been seen for this many frames
+TRACK_TTL=50
+
+# Class names that are tracked and counted
+COUNT_CLASSES=('person',)
+
+# Inference size that keeps the ROI at the scale a full frame had at 640px
+DEFAULT_IMGSZ=DEFAULT_ROI.inference_size(640/FRAME_SIZE[0])
+
+def serializeCountData(data):
+    """JSON-ready copy of a count snapshot with the preview frame base64 encoded"""
+    data = dict(data)
+    if data.get('frame_base64') is not None:
+        data['frame_base64'] = base64.b64encode(data['frame_base64']).decode('utf-8')
+    return data
+
+# Global count state for access from other modules
+count_state = SnapshotStore({
     'entering': 0,
     'exiting': 0,
     'last_updated': time.time(),
     'processing_complete': False,
     'frame_base64': None
-}
+}, serializeCountData)
+
+class ZoneCounter:
+    """
+    Tracks people between frames and counts a track once when it moves from
+    area2 into area1 (entering) or from area1 into area2 (exiting). Counter
+    runs it on live detections, replays run it on cached ones.
+    """
+    def __init__(self,area1,area2,classes=COUNT_CLASSES,classList=None,ttl=TRACK_TTL):
+        self.area1=np.array(area1,np.int32)
+        self.area2=np.array(area2,np.int32)
+        self.classes=tuple(classes)
+        self.classList=showDatainFile() if classList is None else classList
+        self.tracker=Tracker()
+        # Live tracks keep their zone flags; finished tracks only survive in the totals
+        self.tracks=TrackStore(ttl=ttl)
+        self.entering=0
+        self.exiting=0
+    
+    def inZone(self,zone,x,y):
+        return cv.pointPolygonTest(zone,(x,y),False)>=0
+    
+    def update(self,detections,frame):
+        """
+        Track the (N, 6) detections of a frame. Returns the tracked boxes as
+        (x3,y3,x4,y4,id,c,hits), hits naming what the box touched in drawing
+        order ('area2', 'entering', 'area1', 'exiting'), and the new crossings
+        as (id, direction).
+        """
+        boxes=[]
+        c=''
+        for row in detections:
+            c=self.classList[int(row[5])]
+            if c in self.classes:
+                boxes.append([int(row[0]),int(row[1]),int(row[2]),int(row[3])])
+        
+        tracked=[]
+        crossings=[]
+        for x3,y3,x4,y4,id in self.tracker.update(boxes):
+            self.tracks.touch(id,(x4,y4),frame)
+            hits=[]
+            if self.inZone(self.area2,x4,y4):
+                self.tracks.set_flag(id,IN_AREA2)
+                hits.append('area2')
+            if self.tracks.has_flag(id,IN_AREA2) and self.inZone(self.area1,x4,y4):
+                hits.append('entering')
+                if not self.tracks.has_flag(id,COUNTED_ENTERING):
+                    self.tracks.set_flag(id,COUNTED_ENTERING)
+                    self.entering+=1
+                    crossings.append((id,ENTERING))
+            if self.inZone(self.area1,x4,y4):
+                self.tracks.set_flag(id,IN_AREA1)
+                hits.append('area1')
+            if self.tracks.has_flag(id,IN_AREA1) and self.inZone(self.area2,x4,y4):
+                hits.append('exiting')
+                if not self.tracks.has_flag(id,COUNTED_EXITING):
+                    self.tracks.set_flag(id,COUNTED_EXITING)
+                    self.exiting+=1
+                    crossings.append((id,EXITING))
+            tracked.append((x3,y3,x4,y4,id,c,hits))
+        
+        self.tracks.evict(frame)
+        return tracked,crossings
 
 def RGB(event, x, y, flags, param):
     if event == cv.EVENT_MOUSEMOVE :  
@@ -26,142 +127,176 @@ def RGB(event, x, y, flags, param):
         print(colorsBGR)
 
 class Counter:
-    def __init__(self,video,model):
+    def __init__(self,video,model,roi=DEFAULT_ROI,detect_every=1,scene_threshold=None,export=False,
+                 preview=True,cleanup=True,series=None,source='default',recorded_at=None,
+                 start=None,end=None,areas=None,classes=None,cache_detections=True):
         self.video=video
         self.model=model
+        self.roi=roi
         self.classList=showDatainFile()
-        self.tracker=Tracker()
         
-        self.font=cv.FONT_HERSHEY_COMPLEX
+        # Counting zones (entering is area2 then area1) and counted classes
+        self.area1,self.area2=areas or (area1,area2)
+        self.labels=((504,471),(466,485)) if areas is None else (tuple(max(self.area1)),tuple(max(self.area2)))
+        self.classes=tuple(classes or COUNT_CLASSES)
         
-        self.people_entering = {}
-        self.entering=set()
+        # Per-frame detections are saved so zones and classes can be changed without inference
+        self.cache_detections=cache_detections
+        self.cache=None
         
-        self.people_exiting = {}
-        self.exiting = set()
+        self.font=cv.FONT_HERSHEY_COMPLEX
+        
+        self.zones=ZoneCounter(self.area1,self.area2,self.classes,self.classList)
         
         self.processing = False
-        self.lock = threading.Lock()
+        self.stages = StageTimer('counter')
+        
+        # Write the annotated video to the results directory instead of JPEG previews
+        self.export=export
+        self.exporter=None
+        # Headless runs (batch) skip the JPEG previews and keep their input file
+        self.preview=preview
+        self.cleanup=cleanup
+        
+        # Crossings go to a CountSeries under source, timed as recorded_at (epoch of the
+        # first frame, default: when processing starts) plus the frame's video timestamp
+        self.series=series
+        self.source=source
+        self.recorded_at=recorded_at
+        self.timestamp=0.0
+        
+        # Only analyze the video between start and end (seconds)
+        self.start=start
+        self.end=end
+        
+        # Run the detector every detect_every frames and propagate boxes in between;
+        # tracking and line crossing still see every frame
+        self.detect=DetectThenTrack(model,roi,None,detect_every,scene_threshold,self.stages)
+
+    @property
+    def entering(self):
+        return self.zones.entering
+    
+    @property
+    def exiting(self):
+        return self.zones.exiting
 
     def drawTowPolylines(self,frame):
-        cv.polylines(frame,[np.array(area1,np.int32)],True,(255,0,0),2)
-        cv.putText(frame,str('1'),(504,471),self.font,(1),(0,0,0),2)
+        cv.polylines(frame,[np.array(self.area1,np.int32)],True,(255,0,0),2)
+        cv.putText(frame,str('1'),self.labels[0],self.font,(1),(0,0,0),2)
 
-        cv.polylines(frame,[np.array(area2,np.int32)],True,(255,0,0),2)
-        cv.putText(frame,str('2'),(466,485),self.font,(1),(0,0,0),2)
-        
-        i = len(self.entering)
-        o = len(self.exiting)
-        
-        # Update global count data
-        global count_data
-        with self.lock:
-            count_data['entering'] = i
-            count_data['exiting'] = o
-            count_data['last_updated'] = time.time()
+        cv.polylines(frame,[np.array(self.area2,np.int32)],True,(255,0,0),2)
+        cv.putText(frame,str('2'),self.labels[1],self.font,(1),(0,0,0),2)
     
-    def peopleEntering(self,frame,x3,y3,x4,y4,id,c):
-        results = cv.pointPolygonTest(np.array(area2,np.int32) ,((x4,y4)) , False )
-        if results >=0:
-            self.people_entering[id] = (x4,y4)
-            cv.rectangle(frame,(x3,y3),(x4,y4),(0,0,255),2)
-            
-        if id in self.people_entering:
-            results1 = cv.pointPolygonTest(np.array(area1,np.int32) ,((x4,y4)) , False )
-            if results1 >=0:
+    def drawTrack(self,frame,x3,y3,x4,y4,id,c,hits):
+        for hit in hits:
+            if hit=='area2':
+                cv.rectangle(frame,(x3,y3),(x4,y4),(0,0,255),2)
+            elif hit=='area1':
                 cv.rectangle(frame,(x3,y3),(x4,y4),(0,255,0),2)
+            else:
+                # Crossed into the second zone
+                color,offset=((0,255,0),65) if hit=='entering' else ((0,0,255),55)
+                cv.rectangle(frame,(x3,y3),(x4,y4),color,2)
                 cv.circle(frame , (x4,y4) , 4 , (255,0,255),-1)
                 cv.putText(frame,str(c),(x3,y3-10),self.font,(0.5),(255,255,255),1)
-                cv.putText(frame,str(id),(x3+65,y3-10),self.font,(0.5),(255,0,255),1)
-                self.entering.add(id)
+                cv.putText(frame,str(id),(x3+offset,y3-10),self.font,(0.5),(255,0,255),1)
     
-    def peopleExiting(self,frame,x3,y3,x4,y4,id,c):
-        results2 = cv.pointPolygonTest(np.array(area1,np.int32) ,((x4,y4)) , False )
-        if results2 >=0:
-            self.people_exiting[id] = (x4,y4)
-            cv.rectangle(frame,(x3,y3),(x4,y4),(0,255,0),2)
-        if id in self.people_exiting:
-            results3 = cv.pointPolygonTest(np.array(area2,np.int32) ,((x4,y4)) , False )
-            if results3 >=0:
-                cv.rectangle(frame,(x3,y3),(x4,y4),(0,0,255),2)
-                cv.circle(frame , (x4,y4) , 4 , (255,0,255),-1)
-                cv.putText(frame,str(c),(x3,y3-10),self.font,(0.5),(255,255,255),1)
-                cv.putText(frame,str(id),(x3+55,y3-10),self.font,(0.5),(255,0,255),1)
-                self.exiting.add(id)
+    def recordCrossing(self,id,direction):
+        if self.series is not None:
+            self.series.record(self.source,self.recorded_at+self.timestamp,direction,id)
                 
     def predictModel(self,frame):
-        results=self.model.predict(frame)
-        a=results[0].boxes.data
-        px=pd.DataFrame(a).astype("float")
-        list=[]
-                
-        for index,row in px.iterrows():
-            x1=int(row[0])
-            y1=int(row[1])
-            x2=int(row[2])
-            y2=int(row[3])
-            d=int(row[5])
-            c=self.classList[d]
-            
-            if 'person' in c:
-                list.append([x1,y1,x2,y2])  
-            
-        bbox_id = self.tracker.update(list)
-        
-        for bbox in bbox_id:
-            x3,y3,x4,y4,id = bbox    
-            self.peopleEntering(frame,x3,y3,x4,y4,id,c)
-            self.peopleExiting(frame,x3,y3,x4,y4,id,c)
+        detections,_=self.detect(frame)
+        if self.cache is not None:
+            self.cache.add_frame(self.stages.frame,self.timestamp,detections)
+        self.countDetections(frame,detections)
+    
+    def countDetections(self,frame,detections):
+        with self.stages('track'):
+            tracked,crossings=self.zones.update(detections,self.stages.frame)
+            for id,direction in crossings:
+                self.recordCrossing(id,direction)
+            for box in tracked:
+                self.drawTrack(frame,*box)
                 
     def readVideo(self):
         self.processing = True
         
         # Reset processing_complete flag at start
-        global count_data
-        with self.lock:
-            count_data['processing_complete'] = False
+        count_state.publish(processing_complete=False)
         
-        cap=cv.VideoCapture(self.video)
+        # Frames are scaled to FRAME_SIZE by the decoder
+        cap=open_video(self.video,size=FRAME_SIZE,start=self.start,end=self.end)
+        if self.export:
+            self.exporter=open_export(self.stages.job_id,cap.fps,'counter')
+        if self.recorded_at is None:
+            self.recorded_at=time.time()
+        if self.cache_detections:
+            self.cache=DetectionCacheWriter(cache_dir(self.stages.job_id),{
+                'analyzer':'counter',
+                'video':os.path.basename(self.video),
+                'frame_size':list(FRAME_SIZE),
+                'fps':cap.fps,
+                'roi':list(self.roi.as_tuple()) if self.roi is not None else None,
+                'areas':[self.area1,self.area2],
+                'classes':list(self.classes)
+            })
+        self.stages.start()
         
         try:
             while cap.isOpened() and self.processing:
-                rat,frame=cap.read()
+                self.stages.frame += 1
+                with self.stages('decode'):
+                    rat,frame=cap.read()
                 if rat==False:
                     # Video is complete
-                    with self.lock:
-                        count_data['processing_complete'] = True
                     break
-                
-                frame=cv.resize(frame,(1020,500))
+                self.timestamp=cap.timestamp
                 
                 self.predictModel(frame)
-                self.drawTowPolylines(frame)
+                with self.stages('annotate'):
+                    self.drawTowPolylines(frame)
                 
-                # Convert the frame to base64 for web display with better quality
-                encode_param = [int(cv.IMWRITE_JPEG_QUALITY), 90]
-                _, buffer = cv.imencode('.jpg', frame, encode_param)
-                jpg_as_text = buffer.tobytes()
+                if self.exporter is not None:
+                    # The encoder thread writes the frame; no preview is published
+                    with self.stages('export'):
+                        self.exporter.write(frame)
+                    jpg_as_text=None
+                elif self.preview:
+                    # Convert the frame to base64 for web display with better quality
+                    with self.stages('encode'):
+                        encode_param = [int(cv.IMWRITE_JPEG_QUALITY), 90]
+                        _, buffer = cv.imencode('.jpg', frame, encode_param)
+                        jpg_as_text = buffer.tobytes()
+                else:
+                    jpg_as_text=None
                 
-                # Update global count data with the frame
-                with self.lock:
-                    count_data['frame_base64'] = jpg_as_text
-                
-                if cv.waitKey(1) & 0xFF ==ord("q"):
-                    break
+                # Publish the counts together with the frame
+                count_state.publish(
+                    entering=self.entering,
+                    exiting=self.exiting,
+                    last_updated=time.time(),
+                    frame_base64=jpg_as_text
+                )
                     
         finally:
             cap.release()
-            cv.destroyAllWindows()
             self.processing = False
+            if self.exporter is not None:
+                self.exporter.close()
+            if self.series is not None:
+                self.series.flush()
+            if self.cache is not None:
+                self.cache.close()
+            self.stages.finish()
             
             # Ensure processing_complete is set to True when finished
-            with self.lock:
-                count_data['processing_complete'] = True
-                count_data['frame_base64'] = None
+            count_state.publish(processing_complete=True, frame_base64=None)
             
-            # Clean up the video file
+            # Clean up the uploaded video file
             try:
-                if os.path.exists(self.video):
+                if self.cleanup and os.path.exists(self.video):
                     os.remove(self.video)
             except Exception as e:
                 print(f"Error cleaning up video file: {e}")
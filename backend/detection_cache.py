@@ -0,0 +1,187 @@
+"""
+Per-frame detection cache.
+
+Analyzer runs write the detections each frame was analyzed with (and, for
+plates, every OCR result before any confidence cutoff) into flat binary
+column files in the job's results directory. Reloading maps the columns with
+np.memmap, so tracking, zone counting and filtering can be re-run with new
+parameters straight from the cache, without decoding or inference.
+
+Layout of a cache directory:
+    frames.bin      int64   (F,)    frame number of each cached frame
+    timestamps.bin  float64 (F,)    position of the frame in the video (s)
+    counts.bin      int32   (F,)    detections per frame
+    boxes.bin       float32 (N, 6)  x1, y1, x2, y2, conf, cls in frame coordinates
+    plate_frames.bin  int64   (M,)    frame number of each OCR result
+    plate_boxes.bin   float32 (M, 4)  plate box in frame coordinates
+    plate_conf.bin    float32 (M,)    OCR confidence
+    plate_text.json   list of M strings
+    meta.json       run settings and column lengths; written last
+"""
+import json
+import os
+import numpy as np
+from stages import results_dir
+
+CACHE_DIRNAME = 'detections'
+
+COLUMNS = {
+    'frames': (np.int64, ()),
+    'timestamps': (np.float64, ()),
+    'counts': (np.int32, ()),
+    'boxes': (np.float32, (6,)),
+    'plate_frames': (np.int64, ()),
+    'plate_boxes': (np.float32, (4,)),
+    'plate_conf': (np.float32, ())
+}
+
+# Analyzers whose runs write a detection cache; mask and people runs do not
+REPLAY_ANALYZERS = ('counter', 'plate')
+
+def cache_dir(job_id):
+    return os.path.join(results_dir(job_id, create=False), CACHE_DIRNAME)
+
+class DetectionCacheWriter:
+    """Appends per-frame detections of a run to column files"""
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.meta = dict(meta)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        # An unfinished cache has no meta.json
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        self.files = {name: open(os.path.join(directory, f"{name}.bin"), 'wb') for name in COLUMNS}
+        self.lengths = dict.fromkeys(COLUMNS, 0)
+        self.plate_text = []
+
+    def _write(self, name, values):
+        dtype, shape = COLUMNS[name]
+        values = np.ascontiguousarray(values, dtype).reshape((-1,) + shape)
+        self.files[name].write(values.tobytes())
+        self.lengths[name] += len(values)
+
+    def add_frame(self, frame, timestamp, detections):
+        """Record the detections a frame was analyzed with (an (N, 6) array)"""
+        self._write('frames', [frame])
+        self._write('timestamps', [timestamp or 0.0])
+        self._write('counts', [len(detections)])
+        if len(detections):
+            self._write('boxes', detections)
+
+    def add_plate(self, frame, box, text, confidence):
+        """Record an OCR result, whatever its confidence"""
+        self._write('plate_frames', [frame])
+        self._write('plate_boxes', [box])
+        self._write('plate_conf', [confidence])
+        self.plate_text.append(text)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        with open(os.path.join(self.directory, 'plate_text.json'), 'w') as f:
+            json.dump(self.plate_text, f)
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump(dict(self.meta, lengths=self.lengths), f, indent=2)
+
+class DetectionCache:
+    """Memory-mapped view of a finished detection cache"""
+    def __init__(self, directory):
+        self.directory = directory
+        meta_path = os.path.join(directory, 'meta.json')
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"No complete detection cache in {directory}")
+        with open(meta_path) as f:
+            self.meta = json.load(f)
+        lengths = self.meta['lengths']
+        for name, (dtype, shape) in COLUMNS.items():
+            setattr(self, name, self._map(name, dtype, (lengths[name],) + shape))
+        self.offsets = np.zeros(len(self.counts) + 1, np.int64)
+        np.cumsum(self.counts, dtype=np.int64, out=self.offsets[1:])
+        with open(os.path.join(directory, 'plate_text.json')) as f:
+            self.plate_text = json.load(f)
+
+    def _map(self, name, dtype, shape):
+        if shape[0] == 0:
+            # np.memmap cannot map an empty file
+            return np.zeros(shape, dtype)
+        return np.memmap(os.path.join(self.directory, f"{name}.bin"), dtype, mode='r', shape=shape)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        """Yield (frame, timestamp, detections) in frame order"""
+        for i in range(len(self.frames)):
+            yield int(self.frames[i]), float(self.timestamps[i]), self.boxes[self.offsets[i]:self.offsets[i + 1]]
+
+def load_cache(job_id):
+    return DetectionCache(cache_dir(job_id))
+
+def check_areas(areas, roi):
+    """
+    Validate counting zones for a replay. Zones must lie inside the ROI the
+    run detected in, since nothing outside it was detected or cached.
+    """
+    if not isinstance(areas, (list, tuple)) or len(areas) != 2:
+        raise ValueError('areas must be [area1, area2]')
+    points = []
+    for area in areas:
+        try:
+            area = np.array(area, np.float64)
+        except (TypeError, ValueError):
+            raise ValueError('areas must be lists of [x, y] points')
+        if area.ndim != 2 or area.shape[1] != 2 or len(area) < 3:
+            raise ValueError('each area needs at least three [x, y] points')
+        points.append(area)
+    if roi is not None:
+        x1, y1, x2, y2 = roi
+        points = np.concatenate(points)
+        if ((points[:, 0] < x1) | (points[:, 0] > x2) | (points[:, 1] < y1) | (points[:, 1] > y2)).any():
+            raise ValueError(f"areas reach outside the region detections were cached for: {list(roi)}")
+
+def check_classes(classes, class_list):
+    """Validate the class names to count in a replay against the model's classes"""
+    if not isinstance(classes, (list, tuple)) or not classes:
+        raise ValueError('classes must be a non-empty list of class names')
+    unknown = [c for c in classes if not isinstance(c, str) or c not in class_list]
+    if unknown:
+        raise ValueError(f"Unknown classes: {unknown}")
+
+def replay_counter(cache, areas=None, classes=None):
+    """
+    Re-run tracking and zone counting over cached detections. areas is
+    (area1, area2) as point lists and classes the class names to count;
+    both default to those of the original run.
+    """
+    from counter import ZoneCounter
+    from showClassInModel import showDatainFile
+    if areas is None:
+        areas = cache.meta['areas']
+    else:
+        check_areas(areas, cache.meta.get('roi'))
+    class_list = showDatainFile()
+    if classes is None:
+        classes = cache.meta['classes']
+    else:
+        check_classes(classes, class_list)
+    zones = ZoneCounter(areas[0], areas[1], classes, class_list)
+    for frame, timestamp, detections in cache:
+        zones.update(detections, frame)
+    return {'entering': zones.entering, 'exiting': zones.exiting, 'frames': len(cache)}
+
+def replay_plates(cache, min_confidence):
+    """Plates whose OCR confidence reaches min_confidence, as from a run with that cutoff"""
+    plates = {}
+    for frame, confidence, text in zip(cache.plate_frames, cache.plate_conf, cache.plate_text):
+        if not text or confidence < min_confidence:
+            continue
+        plate = plates.get(text)
+        if plate is None:
+            index = min(int(np.searchsorted(cache.frames, frame)), len(cache.frames) - 1)
+            plates[text] = plate = {'text': text, 'confidence': 0.0, 'detections': 0,
+                                    'timestamp': float(cache.timestamps[index]) if len(cache.frames) else None}
+        plate['confidence'] = max(plate['confidence'], float(confidence))
+        plate['detections'] += 1
+    return {'plates': list(plates.values()), 'detections': sum(p['detections'] for p in plates.values())}
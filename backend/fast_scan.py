@@ -0,0 +1,183 @@
+"""
+Fast approximate scan of a video for triage before a full run.
+
+Only keyframes are decoded (or one frame every sample_every seconds), and
+each is run through the detector at low resolution. Samples are grouped into
+fixed-length segments. For each segment the scan reports how often objects
+were present and how many were in view, with 95% confidence bounds. Segments
+with activity can be queued as full-fidelity jobs restricted to those ranges.
+
+    python fast_scan.py recording.mp4 --analyzer plate --segment 60
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from inference_backend import load_detector
+from roi import detect_in_roi
+from video_decoder import open_video
+
+# Detection size for scanning; small objects are missed, which the bounds absorb
+SCAN_IMGSZ = 320
+
+SEGMENT_SECONDS = 30
+
+PERSON_CLASSES = [0]
+VEHICLE_CLASSES = [2, 3, 5, 7]
+
+# Rough seconds an object stays in view, to turn presence into a count estimate
+DWELL_SECONDS = {'counter': 4.0, 'people': 4.0, 'mask': 6.0, 'plate': 5.0}
+
+# Extra seconds queued before and after each active range
+RANGE_PADDING = 5.0
+
+Z = 1.96
+
+def wilson_interval(hits, n):
+    """95% confidence interval of a proportion"""
+    if n == 0:
+        return 0.0, 1.0
+    p = hits / float(n)
+    denom = 1 + Z * Z / n
+    centre = (p + Z * Z / (2 * n)) / denom
+    spread = Z * math.sqrt(p * (1 - p) / n + Z * Z / (4 * n * n)) / denom
+    return max(0.0, centre - spread), min(1.0, centre + spread)
+
+def mean_interval(values):
+    """
+    Mean count with a 95% normal-approximation interval, clipped at 0. The
+    variance is at least the Poisson variance, so few samples give wide bounds.
+    """
+    n = len(values)
+    if n == 0:
+        return 0.0, 0.0, 0.0
+    mean = sum(values) / float(n)
+    var = sum((v - mean) ** 2 for v in values) / (n - 1) if n > 1 else 0.0
+    spread = Z * math.sqrt(max(var, mean, 1.0 / n) / n)
+    return mean, max(0.0, mean - spread), mean + spread
+
+def _scan_setup(analyzer):
+    """Classes, ROI and frame size the scan uses for an analyzer"""
+    if analyzer == 'counter':
+        from counter import DEFAULT_ROI, FRAME_SIZE
+        return PERSON_CLASSES, DEFAULT_ROI, FRAME_SIZE
+    if analyzer == 'plate':
+        return VEHICLE_CLASSES, None, None
+    return PERSON_CLASSES, None, None
+
+def scan(video_path, analyzer='counter', segment_seconds=SEGMENT_SECONDS, sample_every=None,
+         imgsz=SCAN_IMGSZ, backend=None, min_confidence=0.3):
+    """Return an approximate activity report for a video"""
+    classes, roi, size = _scan_setup(analyzer)
+    detector = load_detector('yolov8n.pt', backend, imgsz=imgsz)
+    if sample_every:
+        cap = open_video(video_path, size=size, fps=1.0 / sample_every)
+    else:
+        cap = open_video(video_path, size=size, keyframes_only=True)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video file {video_path}")
+
+    started = time.time()
+    samples = {}
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            detections = detect_in_roi(detector, frame, roi, classes)
+            count = int((detections[:, 4] >= min_confidence).sum()) if len(detections) else 0
+            samples.setdefault(int(cap.timestamp // segment_seconds), []).append(count)
+    finally:
+        cap.release()
+
+    duration = cap.info['duration'] or (cap.info['frame_count'] / cap.source_fps)
+    dwell = DWELL_SECONDS.get(analyzer, 5.0)
+    segments = []
+    estimate = [0.0, 0.0, 0.0]
+    for index in range(int(math.ceil(duration / segment_seconds)) if duration else max(samples, default=-1) + 1):
+        counts = samples.get(index, [])
+        start = index * segment_seconds
+        length = min(segment_seconds, duration - start) if duration else segment_seconds
+        hits = sum(1 for c in counts if c)
+        low, high = wilson_interval(hits, len(counts))
+        mean, mean_low, mean_high = mean_interval(counts)
+        # Objects in view on average, renewed every dwell seconds
+        for i, value in enumerate((mean, mean_low, mean_high)):
+            estimate[i] += value * length / dwell
+        segments.append({
+            'start': start,
+            'end': start + length,
+            'samples': len(counts),
+            'active': hits > 0,
+            'active_fraction': hits / float(len(counts)) if counts else None,
+            'active_fraction_bounds': [low, high],
+            'mean_objects': mean,
+            'mean_objects_bounds': [mean_low, mean_high],
+            'max_objects': max(counts) if counts else 0
+        })
+
+    return {
+        'video': video_path,
+        'analyzer': analyzer,
+        'duration': duration,
+        'segment_seconds': segment_seconds,
+        'samples': sum(len(c) for c in samples.values()),
+        'scan_seconds': time.time() - started,
+        'any_activity': any(s['active'] for s in segments),
+        'estimated_objects': round(estimate[0]),
+        'estimated_objects_bounds': [math.floor(estimate[1]), math.ceil(estimate[2])],
+        'segments': segments
+    }
+
+def active_ranges(report, padding=RANGE_PADDING):
+    """Merge active segments (plus padding) into (start, end) ranges"""
+    ranges = []
+    for segment in report['segments']:
+        if not segment['active']:
+            continue
+        start = max(0.0, segment['start'] - padding)
+        end = segment['end'] + padding
+        if report['duration']:
+            end = min(end, report['duration'])
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return [tuple(r) for r in ranges]
+
+def queue_full_runs(job_queue, report, backend=None, padding=RANGE_PADDING, priority=0, cleanup=False):
+    """
+    Queue full-fidelity jobs over the active ranges of a scanned video; return
+    their ids. With cleanup the video is deleted once the last of them finishes.
+    """
+    jobs = []
+    for start, end in active_ranges(report, padding):
+        options = {'start': start, 'end': end, 'cleanup': cleanup}
+        if backend:
+            options['backend'] = backend
+        jobs.append((report['analyzer'], os.path.abspath(report['video']), options))
+    # One transaction, so a finished job cannot delete the video before its siblings are queued
+    return job_queue.enqueue_many(jobs, priority=priority)
+
+def main():
+    parser = argparse.ArgumentParser(description='Approximate activity scan of a video')
+    parser.add_argument('video')
+    parser.add_argument('--analyzer', default='counter', choices=sorted(DWELL_SECONDS))
+    parser.add_argument('--segment', type=float, default=SEGMENT_SECONDS, help='segment length in seconds')
+    parser.add_argument('--sample-every', type=float, help='seconds between samples (default: keyframes)')
+    parser.add_argument('--imgsz', type=int, default=SCAN_IMGSZ)
+    parser.add_argument('--backend')
+    parser.add_argument('--queue', action='store_true', help='queue full runs for the active segments')
+    args = parser.parse_args()
+
+    report = scan(args.video, args.analyzer, args.segment, args.sample_every, args.imgsz, args.backend)
+    if args.queue:
+        from job_queue import JobQueue
+        report['queued_jobs'] = queue_full_runs(JobQueue(), report, args.backend)
+    print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import queue
+from multiprocessing import shared_memory
+import numpy as np
+
+class FrameRing:
+    """
+    Ring of fixed-size frame slots in shared memory. The owning process writes
+    frames into free slots and passes (slot, shape, dtype) descriptors to other
+    processes, which map the same slot without copying or pickling the frame.
+    """
+    def __init__(self, slots, slot_bytes, name=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+            self.free = queue.Queue()
+            for slot in range(slots):
+                self.free.put(slot)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.free = None
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def acquire(self, timeout=None):
+        """Take a free slot, blocking while all slots are in flight"""
+        return self.free.get(timeout=timeout)
+
+    def release(self, slot):
+        self.free.put(slot)
+
+    def in_flight(self):
+        return self.slots - self.free.qsize()
+
+    def view(self, slot, shape, dtype):
+        """NumPy array over a slot"""
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def write(self, slot, frame):
+        """Copy a frame into a slot and return its descriptor"""
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes does not fit a {self.slot_bytes} byte slot")
+        np.copyto(self.view(slot, frame.shape, frame.dtype), frame)
+        return slot, frame.shape, frame.dtype.str
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
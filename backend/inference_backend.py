@@ -0,0 +1,264 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+from ultralytics import YOLO
+import metrics
+
+# Backend used when a caller does not ask for one explicitly
+DEFAULT_BACKEND = os.environ.get('SENTINEL_INFERENCE_BACKEND', 'torch')
+DEFAULT_INT8 = os.environ.get('SENTINEL_INFERENCE_INT8', '0') == '1'
+BACKENDS = ('torch', 'onnx', 'openvino')
+
+# Exported artifacts are cached here and reused across runs
+MODEL_CACHE_DIR = os.environ.get('SENTINEL_MODEL_CACHE', 'models')
+
+# Detectors are cached per thread: ultralytics predictors keep per-call state
+_local = threading.local()
+
+# One export at a time per process; other processes are handled by atomic publishing
+_export_lock = threading.Lock()
+
+def artifact_path(model_path, backend, int8=False, imgsz=640):
+    """Return where the exported artifact for a model/backend pair is cached"""
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    suffix = '_int8' if int8 else ''
+    if backend == 'onnx':
+        return os.path.join(MODEL_CACHE_DIR, f"{stem}_{imgsz}{suffix}.onnx")
+    return os.path.join(MODEL_CACHE_DIR, f"{stem}_{imgsz}{suffix}_openvino_model")
+
+def _is_stale(artifact, model_path):
+    if not os.path.exists(artifact):
+        return True
+    # Re-export when the source weights are newer than the cached artifact
+    return os.path.exists(model_path) and os.path.getmtime(model_path) > os.path.getmtime(artifact)
+
+def _quantize_onnx(fp32_path, int8_path):
+    """Dynamic INT8 weight quantization of an exported ONNX model"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QUInt8)
+
+def _publish(exported, artifact, model_path, workdir):
+    """Move a finished export into the cache with an atomic rename"""
+    try:
+        os.replace(exported, artifact)
+    except OSError:
+        # A non-empty directory (OpenVINO) cannot be replaced in one step
+        if not _is_stale(artifact, model_path):
+            return  # another process published it first
+        os.replace(artifact, os.path.join(workdir, 'previous'))
+        os.replace(exported, artifact)
+
+def export_model(model_path, backend, int8=False, imgsz=640):
+    """
+    Export YOLO weights for an optimized CPU runtime and cache the result on disk.
+    Returns the path of the cached artifact.
+
+    The export runs on a private copy of the weights in a temporary directory
+    (ultralytics writes next to the weights) and is renamed into place when
+    complete, so concurrent exports never read or clobber partial files.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    if backend == 'torch':
+        return model_path
+
+    artifact = artifact_path(model_path, backend, int8, imgsz)
+    if not _is_stale(artifact, model_path):
+        return artifact
+
+    with _export_lock:
+        if not _is_stale(artifact, model_path):
+            return artifact
+        os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+        if not os.path.exists(model_path):
+            # Named weights (yolov8n.pt) are downloaded on first load
+            YOLO(model_path)
+
+        workdir = tempfile.mkdtemp(prefix='export-', dir=MODEL_CACHE_DIR)
+        try:
+            weights = os.path.join(workdir, os.path.basename(model_path))
+            shutil.copy2(model_path, weights)
+            model = YOLO(weights)
+            print(f"Exporting {model_path} to {backend}{' (int8)' if int8 else ''} at {imgsz}px")
+
+            if backend == 'onnx':
+                exported = model.export(format='onnx', imgsz=imgsz, dynamic=False, simplify=True)
+                if int8:
+                    quantized = os.path.join(workdir, 'int8.onnx')
+                    _quantize_onnx(exported, quantized)
+                    exported = quantized
+            else:
+                exported = model.export(format='openvino', imgsz=imgsz, int8=int8)
+            _publish(str(exported), artifact, model_path, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return artifact
+
+class Detector:
+    """
+    YOLO object detector running on a pluggable CPU inference backend.
+    All backends return detections as an (N, 6) array of x1, y1, x2, y2, conf, cls.
+    """
+    def __init__(self, model_path='yolov8n.pt', backend=None, int8=None, imgsz=640):
+        self.model_path = model_path
+        self.backend = backend or DEFAULT_BACKEND
+        self.int8 = DEFAULT_INT8 if int8 is None else int8
+        self.imgsz = imgsz
+
+        start = time.perf_counter()
+        weights = export_model(model_path, self.backend, self.int8, imgsz)
+        self.model = YOLO(weights, task='detect')
+        self.names = self.model.names
+        # Calls are serialized in case a detector is handed to another thread
+        self.lock = threading.Lock()
+        metrics.model_load_seconds.observe(time.perf_counter() - start, model_path, self.backend)
+
+    def detect(self, frame, classes=None):
+        """Run the detector on one BGR frame"""
+        with self.lock:
+            results = self.model.predict(frame, classes=classes, imgsz=self.imgsz, verbose=False)
+        return results[0].boxes.data.cpu().numpy()
+
+    def detect_batch(self, frames, classes=None):
+        """Run the detector on a list of BGR frames"""
+        if not frames:
+            return []
+        if self.backend != 'torch':
+            # Exported models have a static batch size of 1
+            return [self.detect(frame, classes) for frame in frames]
+        with self.lock:
+            results = self.model.predict(frames, classes=classes, imgsz=self.imgsz, verbose=False)
+        return [r.boxes.data.cpu().numpy() for r in results]
+
+    def __call__(self, frame, classes=None):
+        return self.detect(frame, classes)
+
+def load_detector(model_path='yolov8n.pt', backend=None, int8=None, imgsz=640):
+    """
+    Return this thread's Detector, loading (and exporting) it on first use.
+    Analyzer jobs each run on their own thread and so get their own model;
+    single-threaded workers (batch, job queue) reuse one model for every file.
+    With SENTINEL_INFERENCE_WORKERS set, the detector runs in the worker processes.
+    """
+    backend = backend or DEFAULT_BACKEND
+    int8 = DEFAULT_INT8 if int8 is None else int8
+    key = (model_path, backend, int8, imgsz)
+
+    from inference_pool import INFERENCE_WORKERS
+    if INFERENCE_WORKERS > 0:
+        from inference_pool import get_pool, RemoteDetector
+        return RemoteDetector(get_pool(), *key)
+
+    detectors = getattr(_local, 'detectors', None)
+    if detectors is None:
+        detectors = _local.detectors = {}
+    detector = detectors.get(key)
+    if detector is None:
+        detector = detectors[key] = Detector(model_path, backend, int8, imgsz)
+    return detector
+
+def _box_iou(a, b):
+    """IoU matrix between two (N, 4) and (M, 4) xyxy box arrays"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+def _match(reference, candidate, iou_threshold=0.5):
+    """Greedy same-class matching; returns the number of matched boxes"""
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0
+    iou = _box_iou(reference[:, :4], candidate[:, :4])
+    iou[reference[:, None, 5] != candidate[None, :, 5]] = 0
+    matched = 0
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < iou_threshold:
+            break
+        matched += 1
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return matched
+
+def compare_backends(video_path, model_path='yolov8n.pt', backends=None, max_frames=100, imgsz=640):
+    """
+    Benchmark the available backends against the PyTorch path on a video.
+    Accuracy is reported as recall/precision relative to the PyTorch detections.
+    """
+    import cv2
+    backends = backends or [('onnx', False), ('onnx', True), ('openvino', False)]
+
+    frames = []
+    cap = cv2.VideoCapture(video_path)
+    while cap.isOpened() and len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise ValueError(f"Could not read frames from {video_path}")
+
+    def run(backend, int8):
+        detector = Detector(model_path, backend, int8, imgsz)
+        detector.detect(frames[0])  # warm-up
+        latencies = []
+        detections = []
+        for frame in frames:
+            start = time.perf_counter()
+            detections.append(detector.detect(frame))
+            latencies.append(time.perf_counter() - start)
+        return np.array(latencies) * 1000, detections
+
+    ref_latency, ref_detections = run('torch', False)
+    report = [{
+        'backend': 'torch',
+        'int8': False,
+        'mean_ms': float(ref_latency.mean()),
+        'p95_ms': float(np.percentile(ref_latency, 95)),
+        'speedup': 1.0,
+        'recall': 1.0,
+        'precision': 1.0
+    }]
+
+    for backend, int8 in backends:
+        try:
+            latency, detections = run(backend, int8)
+        except Exception as e:
+            print(f"Skipping {backend}{' int8' if int8 else ''}: {e}")
+            continue
+        matched = sum(_match(r, d) for r, d in zip(ref_detections, detections))
+        n_ref = sum(len(r) for r in ref_detections)
+        n_out = sum(len(d) for d in detections)
+        report.append({
+            'backend': backend,
+            'int8': int8,
+            'mean_ms': float(latency.mean()),
+            'p95_ms': float(np.percentile(latency, 95)),
+            'speedup': float(ref_latency.mean() / latency.mean()),
+            'recall': matched / n_ref if n_ref else 1.0,
+            'precision': matched / n_out if n_out else 1.0
+        })
+
+    return report
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Compare inference backends against PyTorch')
+    parser.add_argument('video')
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--imgsz', type=int, default=640)
+    args = parser.parse_args()
+
+    print(json.dumps(compare_backends(args.video, args.model, max_frames=args.frames, imgsz=args.imgsz), indent=2))
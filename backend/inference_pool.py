@@ -0,0 +1,221 @@
+"""
+Multi-process inference.
+
+Detector calls from analyzer threads are sent to worker processes, so Python-side
+inference work of concurrent jobs runs on separate interpreters instead of
+contending for one GIL. Frames travel through a shared-memory FrameRing; only
+small descriptors go through the task queue and only the (N, 6) detection arrays
+come back.
+"""
+import atexit
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from frame_ring import FrameRing
+import metrics
+
+# Number of inference worker processes; 0 keeps inference in-process
+INFERENCE_WORKERS = int(os.environ.get('SENTINEL_INFERENCE_WORKERS', '0'))
+
+# Slot size fits a 4K BGR frame
+DEFAULT_SLOT_BYTES = 3840 * 2160 * 3
+
+# Seconds to wait for a worker (or a free ring slot) before giving up on a frame
+RESULT_TIMEOUT = 120
+
+# Seconds between checks that the worker processes are still alive
+LIVENESS_INTERVAL = 1.0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _worker_main(index, ring_name, slots, slot_bytes, tasks, results, current, threads):
+    """Worker process loop: map frames from the ring and run the detector"""
+    import torch
+    import cv2
+    from inference_backend import Detector
+
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+
+    ring = FrameRing(slots, slot_bytes, name=ring_name)
+    detectors = {}
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            request_id, key, (slot, shape, dtype), classes = task
+            # Lets the pool fail this request if the process dies while running it
+            current[index] = request_id
+            try:
+                detector = detectors.get(key)
+                if detector is None:
+                    detector = detectors[key] = Detector(*key)
+                frame = ring.view(slot, shape, dtype)
+                results.put((request_id, detector.detect(frame, classes), None))
+            except Exception as e:
+                results.put((request_id, None, f"{type(e).__name__}: {e}"))
+            current[index] = -1
+    finally:
+        ring.close()
+
+class InferencePool:
+    """Inference worker processes fed through a shared-memory frame ring"""
+    def __init__(self, workers, slots=None, slot_bytes=DEFAULT_SLOT_BYTES):
+        self.ctx = multiprocessing.get_context('spawn')
+        self.ring = FrameRing(slots or workers * 2, slot_bytes)
+        self.slot_bytes = slot_bytes
+        self.tasks = self.ctx.Queue()
+        self.results = self.ctx.Queue()
+        self.pending = {}
+        # Ring slot of every request until its reply arrives, including abandoned ones,
+        # so a slow worker never reads a slot that was handed to another frame
+        self.in_flight = {}
+        self.pending_lock = threading.Lock()
+        self.ids = itertools.count()
+
+        # Request id each worker is running, -1 while idle
+        self.current = self.ctx.Array('q', [-1] * workers, lock=False)
+        self.threads = max(1, (os.cpu_count() or 1) // workers)
+        self.closing = False
+        self.processes = [self._start_worker(index) for index in range(workers)]
+
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def _start_worker(self, index):
+        process = self.ctx.Process(target=_worker_main, daemon=True,
+                                   args=(index, self.ring.name, self.ring.slots, self.slot_bytes,
+                                         self.tasks, self.results, self.current, self.threads))
+        process.start()
+        return process
+
+    def _dispatch(self):
+        """Route results from the workers to the waiting analyzer threads"""
+        next_check = time.time() + LIVENESS_INTERVAL
+        while True:
+            try:
+                item = self.results.get(timeout=LIVENESS_INTERVAL)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                self._finish(*item)
+            if time.time() >= next_check:
+                self._check_workers()
+                next_check = time.time() + LIVENESS_INTERVAL
+
+    def _check_workers(self):
+        """Fail the request of any worker that died and start a replacement"""
+        for index, process in enumerate(self.processes):
+            if self.closing or process.is_alive():
+                continue
+            request_id = self.current[index]
+            self.current[index] = -1
+            print(f"Inference worker {process.pid} exited with code {process.exitcode}, restarting it")
+            if request_id >= 0:
+                self._finish(request_id, None, f"worker exited with code {process.exitcode}")
+            self.processes[index] = self._start_worker(index)
+
+    def _finish(self, request_id, detections, error):
+        """Release a request's ring slot and resolve its future"""
+        with self.pending_lock:
+            future = self.pending.pop(request_id, None)
+            slot = self.in_flight.pop(request_id, None)
+            metrics.queue_depth.set(len(self.pending), 'inference')
+        if slot is not None:
+            self.ring.release(slot)
+        if future is None:
+            return
+        if error:
+            future.set_exception(RuntimeError(f"Inference worker failed: {error}"))
+        else:
+            future.set_result(detections)
+
+    def submit(self, key, frame, classes=None):
+        """Queue a frame for a detector (identified by its load_detector key); return (request id, future)"""
+        try:
+            slot = self.ring.acquire(timeout=RESULT_TIMEOUT)
+        except queue.Empty:
+            raise TimeoutError(f"No free frame slot after {RESULT_TIMEOUT}s; inference workers are not keeping up")
+        try:
+            descriptor = self.ring.write(slot, frame)
+        except Exception:
+            self.ring.release(slot)
+            raise
+        request_id = next(self.ids)
+        future = Future()
+        with self.pending_lock:
+            self.pending[request_id] = future
+            self.in_flight[request_id] = slot
+            metrics.queue_depth.set(len(self.pending), 'inference')
+        # The dispatcher releases the slot when the worker replies
+        self.tasks.put((request_id, key, descriptor, classes))
+        return request_id, future
+
+    def collect(self, requests, timeout=RESULT_TIMEOUT):
+        """
+        Wait for submitted requests and return their detections in order. On
+        timeout the remaining requests are abandoned; their slots stay out of
+        the ring until the worker replies.
+        """
+        deadline = time.time() + timeout
+        try:
+            return [future.result(timeout=max(0.0, deadline - time.time())) for _, future in requests]
+        except TimeoutError:
+            with self.pending_lock:
+                for request_id, _ in requests:
+                    self.pending.pop(request_id, None)
+                metrics.queue_depth.set(len(self.pending), 'inference')
+            raise
+
+    def detect(self, key, frame, classes=None):
+        """Run a detector on a frame in a worker"""
+        return self.collect([self.submit(key, frame, classes)])[0]
+
+    def detect_batch(self, key, frames, classes=None):
+        """Run a detector on several frames, spread over the workers"""
+        return self.collect([self.submit(key, frame, classes) for frame in frames])
+
+    def close(self):
+        self.closing = True
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+        self.results.put(None)
+        self.ring.close()
+
+class RemoteDetector:
+    """Detector interface backed by the inference worker pool"""
+    def __init__(self, pool, model_path, backend, int8, imgsz):
+        self.pool = pool
+        self.model_path = model_path
+        self.backend = backend
+        self.int8 = int8
+        self.imgsz = imgsz
+        self.key = (model_path, backend, int8, imgsz)
+
+    def detect(self, frame, classes=None):
+        return self.pool.detect(self.key, frame, classes)
+
+    def detect_batch(self, frames, classes=None):
+        return self.pool.detect_batch(self.key, frames, classes)
+
+    def __call__(self, frame, classes=None):
+        return self.detect(frame, classes)
+
+def get_pool():
+    """Return the process-wide inference pool, starting it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = InferencePool(INFERENCE_WORKERS)
+            atexit.register(_pool.close)
+    return _pool
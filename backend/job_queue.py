@@ -0,0 +1,233 @@
+"""
+Durable analysis job queue on SQLite.
+
+Any number of processes (on one machine, or several sharing the database
+file) enqueue jobs and lease them. A lease is taken in one short IMMEDIATE
+transaction and must be renewed with heartbeat(); jobs whose lease runs out
+because their worker died go back to the queue, and failed jobs are retried
+with backoff until max_attempts. Results and errors are kept on the job row.
+Jobs queued with the cleanup option own their video: it is deleted once the
+job is done or has failed for good and no unfinished job uses the same file.
+
+WAL mode is used by default. On network file systems, where WAL is not safe,
+set SENTINEL_JOB_JOURNAL=DELETE.
+"""
+import json
+import os
+import sqlite3
+import time
+from stages import new_job_id
+
+JOB_DB = os.environ.get('SENTINEL_JOB_DB', os.path.join('uploads', 'jobs.db'))
+JOURNAL_MODE = os.environ.get('SENTINEL_JOB_JOURNAL', 'WAL')
+
+# Seconds a lease lasts without a heartbeat
+LEASE_SECONDS = 60
+
+# Delay before the first retry of a failed job; doubles with each attempt
+RETRY_DELAY = 10
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    analyzer TEXT NOT NULL,
+    video TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority DESC, available_at);
+CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (status, lease_expires);
+"""
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job['options'] = json.loads(job['options'])
+    job['result'] = json.loads(job['result']) if job['result'] is not None else None
+    return job
+
+class JobQueue:
+    """SQLite-backed job queue; safe to use from many threads and processes"""
+    def __init__(self, path=JOB_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._connect() as db:
+            db.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        # A connection per call keeps the queue usable from any thread
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute('PRAGMA busy_timeout=30000')
+        return _Connection(db)
+
+    def enqueue(self, analyzer, video, options=None, priority=0, max_attempts=3, job_id=None):
+        """Add a job and return its id"""
+        job_id = job_id or new_job_id()
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, analyzer, video, options, status, priority, max_attempts,"
+                " created, updated, available_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, analyzer, video, json.dumps(options or {}), QUEUED, priority, max_attempts,
+                 now, now, now))
+        return job_id
+
+    def enqueue_many(self, jobs, priority=0, max_attempts=3):
+        """
+        Add (analyzer, video, options) jobs in one transaction and return their ids.
+        Jobs sharing a cleanup video must be queued together, or a worker could
+        finish the first and delete the video before the rest are queued.
+        """
+        job_ids = [new_job_id() for _ in jobs]
+        now = time.time()
+        with self._connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.executemany(
+                    "INSERT INTO jobs (id, analyzer, video, options, status, priority, max_attempts,"
+                    " created, updated, available_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(job_id, analyzer, video, json.dumps(options or {}), QUEUED, priority, max_attempts,
+                      now, now, now) for job_id, (analyzer, video, options) in zip(job_ids, jobs)])
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+        return job_ids
+
+    def lease(self, worker_id, lease_seconds=LEASE_SECONDS):
+        """Take the next ready job for worker_id, or return None"""
+        now = time.time()
+        with self._connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                failed = self._expire_leases(db, now)
+                row = db.execute(
+                    "SELECT id FROM jobs WHERE status = ? AND available_at <= ?"
+                    " ORDER BY priority DESC, available_at LIMIT 1", (QUEUED, now)).fetchone()
+                job = None
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1,"
+                        " updated = ? WHERE id = ?",
+                        (RUNNING, worker_id, now + lease_seconds, now, row['id']))
+                    job = db.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+        for job_id in failed:
+            self._release_video(job_id)
+        return _row_to_job(job)
+
+    def _expire_leases(self, db, now):
+        """Requeue (or fail) running jobs whose worker stopped sending heartbeats; return the failed ids"""
+        failed = [row['id'] for row in db.execute(
+            "SELECT id FROM jobs WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+            (RUNNING, now))]
+        db.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,"
+            " error = 'lease expired', lease_owner = NULL, lease_expires = NULL, updated = ?"
+            " WHERE status = ? AND lease_expires < ?",
+            (FAILED, QUEUED, now, RUNNING, now))
+        return failed
+
+    def _release_video(self, job_id):
+        """Delete a finished cleanup job's video unless an unfinished job still uses it"""
+        with self._connect() as db:
+            job = db.execute("SELECT video, options, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None or job['status'] not in (DONE, FAILED) or not json.loads(job['options']).get('cleanup'):
+                return False
+            users = db.execute("SELECT COUNT(*) AS n FROM jobs WHERE video = ? AND status IN (?, ?)",
+                               (job['video'], QUEUED, RUNNING)).fetchone()['n']
+        if users or not os.path.exists(job['video']):
+            return False
+        os.remove(job['video'])
+        return True
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=LEASE_SECONDS):
+        """Extend a lease; returns False if the worker no longer holds it"""
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+                (now + lease_seconds, now, job_id, worker_id, RUNNING))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result):
+        """Record the result of a leased job"""
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_owner = NULL, lease_expires = NULL,"
+                " updated = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+                (DONE, json.dumps(result), time.time(), job_id, worker_id, RUNNING))
+            completed = cursor.rowcount == 1
+        if completed:
+            self._release_video(job_id)
+        return completed
+
+    def fail(self, job_id, worker_id, error, retry_delay=RETRY_DELAY):
+        """Record a failure; the job is retried with backoff until max_attempts"""
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,"
+                " available_at = ? + ? * (1 << (attempts - 1)), error = ?,"
+                " lease_owner = NULL, lease_expires = NULL, updated = ?"
+                " WHERE id = ? AND lease_owner = ? AND status = ?",
+                (FAILED, QUEUED, now, retry_delay, error, now, job_id, worker_id, RUNNING))
+            recorded = cursor.rowcount == 1
+        if recorded:
+            # Only deletes the video once the job has run out of attempts
+            self._release_video(job_id)
+        return recorded
+
+    def get(self, job_id):
+        with self._connect() as db:
+            return _row_to_job(db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def jobs(self, status=None, limit=100):
+        """Most recent jobs, optionally with one status"""
+        with self._connect() as db:
+            if status:
+                rows = db.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created DESC LIMIT ?",
+                                  (status, limit)).fetchall()
+            else:
+                rows = db.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+    def counts(self):
+        """Number of jobs per status"""
+        with self._connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+class _Connection:
+    """Context manager closing a connection (sqlite3's own only ends transactions)"""
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, *exc):
+        self.db.close()
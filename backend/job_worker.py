@@ -0,0 +1,101 @@
+"""
+Worker processes pulling analysis jobs from the durable job queue.
+
+Each worker leases one job at a time, renews the lease from a heartbeat
+thread while the analyzer runs, and records the result or the error. Workers
+share nothing but the queue database and the upload/results directories, so
+more throughput comes from starting more of them, here or on other machines.
+
+    python job_worker.py --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+from batch import analyze, _init_worker
+from job_queue import JobQueue, JOB_DB, LEASE_SECONDS
+from stages import results_dir
+
+# Seconds between polls of an empty queue
+POLL_INTERVAL = 1.0
+
+class JobWorker:
+    """Lease-run-report loop over a JobQueue"""
+    def __init__(self, queue, worker_id=None, lease_seconds=LEASE_SECONDS, poll_interval=POLL_INTERVAL):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.stop_flag = False
+
+    def _heartbeat(self, job_id, done):
+        while not done.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(job_id, self.worker_id, self.lease_seconds):
+                print(f"Worker {self.worker_id} lost the lease on job {job_id}")
+                return
+
+    def run_job(self, job):
+        """Run one leased job and report its outcome"""
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job['id'], done), daemon=True)
+        heartbeat.start()
+        options = job['options']
+        try:
+            result = analyze(job['analyzer'], job['video'], results_dir(job['id']),
+                             options.get('backend'), job['id'], options.get('start'), options.get('end'))
+        except Exception as e:
+            traceback.print_exc()
+            done.set()
+            self.queue.fail(job['id'], self.worker_id, f"{type(e).__name__}: {e}")
+            return False
+        done.set()
+        # The queue deletes the uploaded video once no unfinished job uses it
+        self.queue.complete(job['id'], self.worker_id, result)
+        return True
+
+    def run(self, drain=False):
+        """Process jobs until stopped (or, with drain, until the queue is empty)"""
+        print(f"Worker {self.worker_id} started")
+        while not self.stop_flag:
+            job = self.queue.lease(self.worker_id, self.lease_seconds)
+            if job is None:
+                if drain:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            print(f"Worker {self.worker_id} running {job['analyzer']} job {job['id']} (attempt {job['attempts']})")
+            self.run_job(job)
+
+def _worker_main(db_path, threads, drain):
+    _init_worker(threads)
+    try:
+        JobWorker(JobQueue(db_path)).run(drain)
+    except KeyboardInterrupt:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Process analysis jobs from the job queue')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--db', default=JOB_DB)
+    parser.add_argument('--drain', action='store_true', help='exit once the queue is empty')
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    ctx = multiprocessing.get_context('spawn')
+    processes = [ctx.Process(target=_worker_main, args=(args.db, threads, args.drain))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,19 @@
-
+import argparse
 from counter import *
 from showClassInModel import *
-from ultralytics import YOLO
+from inference_backend import load_detector
 
 def main():
-    video = "../peoplecount1.mp4"
-    model = "../yolov8s.pt"
+    parser = argparse.ArgumentParser(description='Count people entering and leaving in one video')
+    parser.add_argument('video', nargs='?', default='../peoplecount1.mp4')
+    parser.add_argument('--model', default='../yolov8s.pt')
+    parser.add_argument('--backend', help='inference backend (torch, onnx, openvino)')
+    args = parser.parse_args()
     
-    model=YOLO(model)    
-    counter=Counter(video,model)
+    model=load_detector(args.model, args.backend)
+    counter=Counter(args.video,model,preview=False,cleanup=False)
     counter()
+    print(f"Entering: {counter.entering}, Exiting: {counter.exiting}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -3,20 +3,59 @@ import numpy as np
 import threading
 import time
 import random
-from ultralytics import YOLO
+import base64
+from ultralytics.utils.plotting import Annotator, colors
+from inference_backend import load_detector
+from propagation import DetectThenTrack
+from video_decoder import open_video
+from video_export import open_export
+from stages import StageTimer
+from snapshots import SnapshotStore
 
-# Global variable to store mask detection data
-mask_data = {
+def serialize_mask_data(data):
+    """JSON-ready copy of a mask snapshot with the preview frame base64 encoded"""
+    frame_base64 = None
+    if data["frame_base64"] is not None:
+        # Use base64 encoding for better browser compatibility
+        frame_base64 = base64.b64encode(data["frame_base64"]).decode('utf-8')
+    
+    return {
+        "timestamp": data["timestamp"],
+        "people": list(data["people"]),
+        "frame_base64": frame_base64,
+        "is_processing": data["is_processing"]
+    }
+
+# Global state to store mask detection data
+mask_state = SnapshotStore({
     "timestamp": None,
-    "people": [],
+    "people": (),
     "frame_base64": None,
     "is_processing": False
-}
+}, serialize_mask_data)
 
 class MaskDetector:
-    def __init__(self, video_path, model_path='yolov8n.pt'):
+    def __init__(self, video_path, model_path='yolov8n.pt', backend=None, roi=None, imgsz=640,
+                 detect_every=1, scene_threshold=None, export=False, preview=True,
+                 start=None, end=None):
         self.video_path = video_path
-        self.model = YOLO(model_path)
+        self.model = load_detector(model_path, backend, imgsz=imgsz)
+        self.roi = roi
+        self.stages = StageTimer('mask')
+        # Class 0 is person in COCO dataset
+        self.detect = DetectThenTrack(self.model, roi, [0], detect_every, scene_threshold, self.stages)
+        # Write the annotated video to the results directory instead of JPEG previews
+        self.export = export
+        self.exporter = None
+        # Headless runs (batch) skip the JPEG previews and the preview pacing
+        self.preview = preview
+        # Only analyze the video between start and end (seconds)
+        self.start = start
+        self.end = end
+        # Totals over the whole run
+        self.frames_processed = 0
+        self.with_mask = 0
+        self.without_mask = 0
         self.is_running = False
         self.cap = None
         self.thread = None
@@ -26,17 +65,28 @@ class MaskDetector:
         if frame is None:
             return frame, []
         
-        # Detect objects with YOLO
-        results = self.model(frame, classes=[0])  # Class 0 is person in COCO dataset
+        # Detect objects with YOLO (or carry the last detections forward)
+        detections, _ = self.detect(frame)
         
-        # Get annotated frame
-        annotated_frame = results[0].plot()
+        with self.stages('annotate'):
+            annotated_frame, detected_people = self.annotate(frame, detections)
+        
+        return annotated_frame, detected_people
+    
+    def annotate(self, frame, detections):
+        """Draw the detector boxes and the mask status of each detected person"""
+        # Get annotated frame, drawn like the detector's own results plot
+        names = getattr(self.model, 'names', None) or {0: 'person'}
+        annotator = Annotator(frame.copy(), example=str(names))
+        for det in detections:
+            cls = int(det[5])
+            annotator.box_label(det[:4], f"{names.get(cls, cls)} {det[4]:.2f}", color=colors(cls, True))
+        annotated_frame = annotator.result()
         detected_people = []
         
         # Process each detection from YOLO
-        for i, result in enumerate(results[0].boxes):
-            box = result.xyxy.tolist()[0]  # Get the box coordinates
-            x1, y1, x2, y2 = map(int, box)
+        for i, det in enumerate(detections):
+            x1, y1, x2, y2 = map(int, det[:4])  # Get the box coordinates
             
             # For demonstration, we'll randomly assign mask status
             # In a real implementation, you would use a trained model to detect masks
@@ -72,58 +122,81 @@ class MaskDetector:
     
     def process_video(self):
         """Process video frames continuously"""
-        global mask_data
-        
-        self.cap = cv2.VideoCapture(self.video_path)
+        self.cap = open_video(self.video_path, start=self.start, end=self.end)
         
         if not self.cap.isOpened():
             print(f"Error: Could not open video file {self.video_path}")
-            mask_data["is_processing"] = False
+            mask_state.publish(is_processing=False)
+            self.stages.cancel()
             return
         
-        mask_data["is_processing"] = True
+        mask_state.publish(is_processing=True)
+        if self.export:
+            self.exporter = open_export(self.stages.job_id, self.cap.fps, 'mask')
+        self.stages.start()
         
-        # Get total frame count
-        total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        frame_count = 0
         reached_end = False
         
-        while self.is_running:
-            ret, frame = self.cap.read()
-            
-            if not ret:
-                # If we reach the end of the video, mark as complete and stop processing
-                if not reached_end:
-                    print("Video processing complete")
-                    reached_end = True
-                    # Set is_processing to False to signal completion
-                    mask_data["is_processing"] = False
-                    self.is_running = False
-                    break
-                continue
-            
-            # Process the frame
-            annotated_frame, detected_people = self.process_frame(frame)
-            
-            # Convert the frame to base64 for web display with better quality
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 90]
-            _, buffer = cv2.imencode('.jpg', annotated_frame, encode_param)
-            jpg_as_text = buffer.tobytes()
-            
-            # Update the global mask data
-            mask_data["timestamp"] = time.time()
-            mask_data["people"] = detected_people
-            mask_data["frame_base64"] = jpg_as_text
-            
-            # Adjust processing speed for smoother video preview
-            # Reduced sleep time for more frequent frame updates
-            time.sleep(0.01)
-        
-        # Release resources when stopped
-        if self.cap:
-            self.cap.release()
+        try:
+            while self.is_running:
+                self.stages.frame += 1
+                with self.stages('decode'):
+                    ret, frame = self.cap.read()
+                
+                if not ret:
+                    # If we reach the end of the video, mark as complete and stop processing
+                    if not reached_end:
+                        print("Video processing complete")
+                        reached_end = True
+                        # Set is_processing to False to signal completion
+                        mask_state.publish(is_processing=False)
+                        self.is_running = False
+                        break
+                    continue
+                
+                # Process the frame
+                annotated_frame, detected_people = self.process_frame(frame)
+                self.frames_processed += 1
+                for person in detected_people:
+                    if person["has_mask"]:
+                        self.with_mask += 1
+                    else:
+                        self.without_mask += 1
+                
+                if self.exporter is not None:
+                    # The encoder thread writes the frame; no preview is published
+                    with self.stages('export'):
+                        self.exporter.write(annotated_frame)
+                    jpg_as_text = None
+                elif self.preview:
+                    # Convert the frame to base64 for web display with better quality
+                    with self.stages('encode'):
+                        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 90]
+                        _, buffer = cv2.imencode('.jpg', annotated_frame, encode_param)
+                        jpg_as_text = buffer.tobytes()
+                else:
+                    jpg_as_text = None
+                
+                # Publish the global mask data
+                mask_state.publish(
+                    timestamp=time.time(),
+                    people=tuple(detected_people),
+                    frame_base64=jpg_as_text
+                )
+                
+                # Adjust processing speed for smoother video preview
+                # Reduced sleep time for more frequent frame updates
+                if self.preview and self.exporter is None:
+                    time.sleep(0.01)
+        finally:
+            # Release resources when stopped
+            if self.cap:
+                self.cap.release()
+            if self.exporter is not None:
+                self.exporter.close()
+            self.stages.finish()
         
-        mask_data["is_processing"] = False
+        mask_state.publish(is_processing=False)
     
     def start_processing(self):
         """Start processing in a separate thread"""
@@ -145,38 +218,4 @@ class MaskDetector:
 
 # Function to get the current mask data
 def get_mask_data():
-    global mask_data
-    try:
-        # Handle frame_base64 data safely
-        frame_base64 = None
-        if mask_data["frame_base64"] is not None:
-            try:
-                # Use base64 encoding for better browser compatibility
-                import base64
-                frame_base64 = base64.b64encode(mask_data["frame_base64"]).decode('utf-8')
-            except (AttributeError, UnicodeDecodeError) as e:
-                print(f"Error encoding frame_base64: {e}")
-                # If encoding fails, try the old method
-                try:
-                    frame_base64 = mask_data["frame_base64"].decode('latin1')
-                except Exception:
-                    # If all fails, just return the raw bytes
-                    if isinstance(mask_data["frame_base64"], bytes):
-                        frame_base64 = mask_data["frame_base64"]
-        
-        return {
-            "timestamp": mask_data["timestamp"],
-            "people": mask_data["people"],
-            "frame_base64": frame_base64,
-            "is_processing": mask_data["is_processing"]
-        }
-    except Exception as e:
-        print(f"Error in get_mask_data: {e}")
-        # Return a safe default response
-        return {
-            "timestamp": None,
-            "people": [],
-            "frame_base64": None,
-            "is_processing": False,
-            "error": str(e)
-        }
+    return mask_state.to_dict()
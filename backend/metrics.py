@@ -0,0 +1,194 @@
+"""
+Process-wide metrics exposed in the Prometheus text format at /api/metrics.
+
+Pipeline stage timings arrive through the stages listener hooks, so collection
+costs one dict lookup and a bucket search per stage and can stay on all the time.
+"""
+import bisect
+import os
+import threading
+from collections import deque
+import stages
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is not reported there
+    resource = None
+
+# Per-job series are kept for this many finished jobs before being dropped
+MAX_FINISHED_JOBS = 20
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOAD_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry = []
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(n, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                     for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+def _format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        _registry.append(self)
+
+    def remove(self, *labelvalues):
+        with self.lock:
+            self.values.pop(labelvalues, None)
+
+    def remove_matching(self, label, value):
+        """Drop every series whose label has the given value"""
+        index = self.labels.index(label)
+        with self.lock:
+            for key in [k for k in self.values if k[index] == value]:
+                del self.values[key]
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labels, key), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines)
+
+class CounterMetric(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        with self.lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+class GaugeMetric(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labelvalues):
+        with self.lock:
+            self.values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount=1):
+        with self.lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+class HistogramMetric(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labelvalues)
+            if series is None:
+                # Per-bucket counts (plus +Inf), sum
+                series = self.values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self.lock:
+            items = [(k, (list(v[0]), v[1])) for k, v in self.values.items()]
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = _format_labels(self.labels + ('le',), key + (bound,))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+frames_decoded = CounterMetric('sentinel_frames_decoded_total', 'Frames decoded', ['analyzer'])
+frames_inferred = CounterMetric('sentinel_frames_inferred_total', 'Frames run through the detector', ['analyzer'])
+frames_dropped = CounterMetric('sentinel_frames_dropped_total', 'Decoded frames skipped without analysis', ['analyzer'])
+preview_encodes = CounterMetric('sentinel_preview_encodes_total', 'Preview JPEG encodes', ['analyzer'])
+export_frames = CounterMetric('sentinel_export_frames_total', 'Annotated frames written to exported videos', ['analyzer'])
+export_frames_dropped = CounterMetric('sentinel_export_frames_dropped_total',
+                                      'Annotated frames dropped because the export encoder stalled', ['analyzer'])
+stage_seconds = HistogramMetric('sentinel_stage_seconds', 'Pipeline stage latency', ['analyzer', 'stage'])
+ocr_calls = CounterMetric('sentinel_ocr_calls_total', 'OCR engine invocations', ['analyzer'])
+queue_depth = GaugeMetric('sentinel_queue_depth', 'Items waiting in a work queue', ['queue'])
+active_jobs = GaugeMetric('sentinel_active_jobs', 'Analyzer jobs currently running', ['analyzer'])
+jobs_total = CounterMetric('sentinel_jobs_total', 'Analyzer jobs finished', ['analyzer'])
+job_frames = CounterMetric('sentinel_job_frames_total', 'Frames decoded per job', ['job', 'analyzer'])
+job_stage_seconds = CounterMetric('sentinel_job_stage_seconds_total', 'Time spent per stage per job',
+                                  ['job', 'analyzer', 'stage'])
+model_load_seconds = HistogramMetric('sentinel_model_load_seconds', 'Model load (and export) time',
+                                     ['model', 'backend'], LOAD_BUCKETS)
+memory_bytes = GaugeMetric('sentinel_process_memory_bytes', 'Process memory', ['kind'])
+
+_finished_jobs = deque()
+_finished_lock = threading.Lock()
+
+def observe_stage(timer, stage, start, end):
+    """Stage listener feeding the stage histograms and frame counters"""
+    duration = end - start
+    stage_seconds.observe(duration, timer.analyzer, stage)
+    job_stage_seconds.inc(timer.job_id, timer.analyzer, stage, amount=duration)
+    if stage == 'decode':
+        frames_decoded.inc(timer.analyzer)
+        job_frames.inc(timer.job_id, timer.analyzer)
+    elif stage == 'infer':
+        frames_inferred.inc(timer.analyzer)
+    elif stage == 'encode':
+        preview_encodes.inc(timer.analyzer)
+
+def observe_job(timer, event):
+    """Job listener tracking active jobs and expiring old per-job series"""
+    if event == 'start':
+        active_jobs.inc(timer.analyzer)
+        return
+    if event == 'cancel':
+        return
+    active_jobs.dec(timer.analyzer)
+    jobs_total.inc(timer.analyzer)
+    with _finished_lock:
+        _finished_jobs.append(timer.job_id)
+        expired = []
+        while len(_finished_jobs) > MAX_FINISHED_JOBS:
+            expired.append(_finished_jobs.popleft())
+    for job_id in expired:
+        job_frames.remove_matching('job', job_id)
+        job_stage_seconds.remove_matching('job', job_id)
+
+def _update_memory():
+    try:
+        with open('/proc/self/statm') as f:
+            rss_pages = int(f.read().split()[1])
+        memory_bytes.set(rss_pages * os.sysconf('SC_PAGE_SIZE'), 'rss')
+    except (OSError, ValueError, IndexError):
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    if resource is not None:
+        memory_bytes.set(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, 'peak_rss')
+
+def render():
+    """Render all metrics in the Prometheus text exposition format"""
+    _update_memory()
+    return '\n'.join(metric.render() for metric in _registry) + '\n'
+
+stages.add_listener(observe_stage)
+stages.add_job_listener(observe_job)
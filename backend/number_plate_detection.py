@@ -1,36 +1,104 @@
 import cv2
 import numpy as np
-import time
 import os
 import pandas as pd
 from datetime import datetime
-from ultralytics import YOLO
+from inference_backend import load_detector
+from propagation import DetectThenTrack
+from video_decoder import open_video
+from video_export import open_export
+from detection_cache import DetectionCacheWriter, cache_dir
+from stages import StageTimer, results_dir
+from plate_store import PlateCropStore
+from plate_localizer import localize_plate, PlateModelLocalizer
+from snapshots import SnapshotStore
+import metrics
 import easyocr
 import threading
-from collections import defaultdict
 import base64
 
-# Initialize EasyOCR reader
-reader = easyocr.Reader(['en'], gpu=False)
+# EasyOCR reader, loaded on first use so importing this module stays cheap
+# (inference worker processes re-import the app on spawn)
+_reader = None
+_reader_lock = threading.Lock()
 
-# Global variables
-plate_data = {
-    "plates": [],
+def get_reader():
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            _reader = easyocr.Reader(['en'], gpu=False)
+    return _reader
+
+def serialize_plate_data(data):
+    return {
+        "plates": list(data["plates"]),
+        "processing_complete": data["processing_complete"],
+        "current_frame": data["current_frame"]
+    }
+
+# Vehicle classes in COCO dataset (car, motorcycle, bus, truck)
+VEHICLE_CLASSES = [2, 3, 5, 7]
+
+# Optional plate-detector weights used instead of the classical plate search
+PLATE_MODEL = os.environ.get('SENTINEL_PLATE_MODEL')
+
+# Plates listed in the live API data; older ones are dropped from the list
+MAX_LISTED_PLATES = 100
+
+# OCR results below this confidence are dropped
+MIN_PLATE_CONFIDENCE = 0.5
+
+# Only every PLATE_FRAME_STEP-th frame is decoded and analyzed
+PLATE_FRAME_STEP = 3
+
+# Global state
+plate_state = SnapshotStore({
+    "plates": (),
     "processing_complete": False,
     "current_frame": None
-}
+}, serialize_plate_data)
 
 class NumberPlateDetector:
-    def __init__(self, video_path, model_path='yolov8n.pt'):
+    def __init__(self, video_path, model_path='yolov8n.pt', backend=None, roi=None, imgsz=640,
+                 detect_every=None, scene_threshold=None, plate_model_path=PLATE_MODEL, export=False,
+                 preview=True, start=None, end=None, min_confidence=MIN_PLATE_CONFIDENCE,
+                 cache_detections=True, frame_step=PLATE_FRAME_STEP):
         self.video_path = video_path
-        self.model = YOLO(model_path)
+        self.model = load_detector(model_path, backend, imgsz=imgsz)
+        self.roi = roi
+        self.stages = StageTimer('plate')
+        
+        # Only every frame_step-th frame is analyzed. With detect_every, vehicles are
+        # detected on every detect_every-th analyzed frame and propagated in between,
+        # and plates are searched for on detector frames only.
+        self.frame_step = max(1, frame_step)
+        self.detect = DetectThenTrack(self.model, roi, VEHICLE_CLASSES, detect_every or 1,
+                                      scene_threshold, self.stages)
+        
+        # A plate-detector model, when configured, runs batched over all vehicles of a frame
+        self.plate_localizer = None
+        if plate_model_path:
+            self.plate_localizer = PlateModelLocalizer(load_detector(plate_model_path, backend, imgsz=320))
+        # Write the annotated video to the results directory instead of JPEG previews
+        self.export = export
+        self.exporter = None
+        # Headless runs (batch) skip the JPEG previews
+        self.preview = preview
+        # Only analyze the video between start and end (seconds)
+        self.start = start
+        self.end = end
+        # OCR results below this confidence are not reported
+        self.min_confidence = min_confidence
+        # Vehicle detections and every OCR result are saved so the cutoff can be changed later
+        self.cache_detections = cache_detections
+        self.cache = None
         self.stop_flag = False
         self.processing_thread = None
-        self.detected_plates = []
-        self.plate_images = []
-        self.plate_confidences = []
-        self.plate_timestamps = []
+        self.plates = []
+        self.plate_store = None
         self.excel_path = os.path.join('uploads', 'license_plates.xlsx')
+        # Plate crops and the detection log (default: 'plates' in the job's results directory)
+        self.plate_dir = None
         
         # Create uploads directory if it doesn't exist
         if not os.path.exists('uploads'):
@@ -38,43 +106,19 @@ class NumberPlateDetector:
     
     def detect_license_plate(self, vehicle_img):
         """
-        Detect license plate in a vehicle image using traditional CV techniques
+        Detect license plate in a vehicle image using traditional CV techniques.
+        Only the lower part of the crop is searched, downscaled, using morphology
+        and edge density instead of a full-resolution contour tree.
         """
-        # Convert to grayscale
-        gray = cv2.cvtColor(vehicle_img, cv2.COLOR_BGR2GRAY)
-        
-        # Apply bilateral filter to remove noise while keeping edges sharp
-        blur = cv2.bilateralFilter(gray, 11, 17, 17)
-        
-        # Find edges
-        edged = cv2.Canny(blur, 30, 200)
-        
-        # Find contours
-        cnts, _ = cv2.findContours(edged.copy(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-        cnts = sorted(cnts, key=cv2.contourArea, reverse=True)[:10]
-        
-        plate_contour = None
-        plate_img = None
-        plate_coords = None
-        
-        # Loop through contours to find license plate
-        for c in cnts:
-            perimeter = cv2.arcLength(c, True)
-            approx = cv2.approxPolyDP(c, 0.02 * perimeter, True)
-            
-            # If contour has 4 points, it might be a license plate
-            if len(approx) == 4:
-                plate_contour = approx
-                x, y, w, h = cv2.boundingRect(c)
-                
-                # Check aspect ratio of potential license plate
-                aspect_ratio = w / float(h)
-                if 2 <= aspect_ratio <= 5.5:  # Common aspect ratio for license plates
-                    plate_img = vehicle_img[y:y+h, x:x+w]
-                    plate_coords = (x, y, w, h)
-                    break
-        
-        return plate_img, plate_coords
+        return localize_plate(vehicle_img)
+    
+    def detect_license_plates(self, vehicle_imgs):
+        """
+        Detect license plates in all vehicle images of a frame
+        """
+        if self.plate_localizer is not None:
+            return self.plate_localizer.localize_batch(vehicle_imgs)
+        return [self.detect_license_plate(img) for img in vehicle_imgs]
     
     def recognize_plate_text(self, plate_img):
         """
@@ -88,7 +132,8 @@ class NumberPlateDetector:
         _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         
         # Recognize text
-        results = reader.readtext(thresh)
+        metrics.ocr_calls.inc('plate')
+        results = get_reader().readtext(thresh)
         
         plate_text = ""
         confidence = 0
@@ -112,66 +157,82 @@ class NumberPlateDetector:
         """
         Process video to detect vehicles and license plates
         """
-        global plate_data
-        
         # Reset plate data
-        plate_data["plates"] = []
-        plate_data["processing_complete"] = False
-        plate_data["current_frame"] = None
+        plate_state.reset({
+            "plates": (),
+            "processing_complete": False,
+            "current_frame": None
+        })
         
         # Clear previous detections
-        self.detected_plates = []
-        self.plate_images = []
-        self.plate_confidences = []
-        self.plate_timestamps = []
+        self.plates = []
+        self.plate_store = PlateCropStore(self.plate_dir or os.path.join(results_dir(self.stages.job_id), 'plates'))
         
-        # Open video file
-        cap = cv2.VideoCapture(self.video_path)
+        # Open video file; frames that are not analyzed are dropped inside the decoder
+        cap = open_video(self.video_path, step=self.frame_step, start=self.start, end=self.end)
         if not cap.isOpened():
             print(f"Error: Could not open video file {self.video_path}")
-            plate_data["processing_complete"] = True
+            plate_state.publish(processing_complete=True)
+            self.stages.cancel()
             return
         
-        # Vehicle classes in COCO dataset (car, motorcycle, bus, truck)
-        vehicle_classes = [2, 3, 5, 7]
+        if self.export:
+            self.exporter = open_export(self.stages.job_id, cap.fps, 'plate')
+        if self.cache_detections:
+            self.cache = DetectionCacheWriter(cache_dir(self.stages.job_id), {
+                'analyzer': 'plate',
+                'video': os.path.basename(self.video_path),
+                'fps': cap.fps,
+                'min_confidence': self.min_confidence
+            })
+        self.stages.start()
         
-        frame_count = 0
-        start_time = time.time()
-        
-        # Process each frame
-        while cap.isOpened() and not self.stop_flag:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame_count += 1
-            
-            # Process every 3 frames to improve performance
-            if frame_count % 3 != 0:
-                continue
-            
-            # Get current timestamp
-            timestamp = time.time() - start_time
+        try:
+            vehicle_classes = VEHICLE_CLASSES
             
-            # Create a copy of the frame for visualization
-            display_frame = frame.copy()
+            frame_count = 0
             
-            # Detect vehicles in the frame
-            results = self.model(frame)
-            
-            # Process each detection
-            for result in results:
-                boxes = result.boxes
-                for box in boxes:
+            # Process each frame
+            while cap.isOpened() and not self.stop_flag:
+                self.stages.frame = frame_count + 1
+                with self.stages('decode'):
+                    ret, frame = cap.read()
+                if not ret:
+                    break
+                
+                frame_count = cap.frame_index + 1
+                
+                # The decoder already skipped the frames between analyzed ones
+                if self.frame_step > 1:
+                    metrics.frames_dropped.inc('plate', amount=self.frame_step - 1)
+                
+                # Position of the frame in the video, so runs over a segment line up with the full video
+                timestamp = cap.timestamp
+                
+                # Create a copy of the frame for visualization
+                display_frame = frame.copy()
+                
+                # Detect vehicles in the frame (or carry the last detections forward)
+                detections, keyframe = self.detect(frame)
+                if self.cache is not None:
+                    self.cache.add_frame(frame_count, timestamp, detections)
+                
+                # Draw every vehicle and collect the crops worth searching for plates
+                vehicles = []
+                for det in detections:
                     # Check if the detected object is a vehicle
-                    cls_id = int(box.cls.item())
+                    cls_id = int(det[5])
                     if cls_id in vehicle_classes:
                         # Get coordinates of the vehicle
-                        x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
+                        x1, y1, x2, y2 = map(int, det[:4])
                         
                         # Draw vehicle bounding box
                         cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
                         
+                        # Plates are only searched for on frames the detector ran on
+                        if not keyframe:
+                            continue
+                        
                         # Extract vehicle image
                         vehicle_img = frame[y1:y2, x1:x2]
                         
@@ -179,96 +240,121 @@ class NumberPlateDetector:
                         if vehicle_img.size == 0 or vehicle_img.shape[0] < 20 or vehicle_img.shape[1] < 20:
                             continue
                         
-                        # Detect license plate in the vehicle
-                        plate_img, plate_coords = self.detect_license_plate(vehicle_img)
-                        
-                        # Skip if no plate is detected
-                        if plate_img is None or plate_img.size == 0 or plate_coords is None:
-                            continue
-                        
-                        # Recognize text on the license plate
+                        vehicles.append((x1, y1, vehicle_img))
+                
+                # Detect license plates in all vehicles at once
+                with self.stages('plate'):
+                    located = self.detect_license_plates([img for _, _, img in vehicles])
+                
+                for (x1, y1, vehicle_img), (plate_img, plate_coords) in zip(vehicles, located):
+                    # Skip if no plate is detected
+                    if plate_img is None or plate_img.size == 0 or plate_coords is None:
+                        continue
+                    
+                    # Recognize text on the license plate
+                    with self.stages('ocr'):
                         plate_text, confidence = self.recognize_plate_text(plate_img)
-                        
-                        # Skip if no text is detected or confidence is too low
-                        if not plate_text or confidence < 0.5:
-                            continue
-                        
-                        # Calculate absolute coordinates of the license plate in the original frame
-                        px, py, pw, ph = plate_coords
-                        abs_x = x1 + px
-                        abs_y = y1 + py
-                        
-                        # Draw license plate bounding box on display frame (red)
-                        cv2.rectangle(display_frame, (abs_x, abs_y), (abs_x + pw, abs_y + ph), (0, 0, 255), 2)
-                        
-                        # Add text above the license plate
-                        cv2.putText(display_frame, plate_text, (abs_x, abs_y - 10), 
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
-                        
-                        # Save the detection
-                        self.detected_plates.append(plate_text)
-                        self.plate_images.append(plate_img)
-                        self.plate_confidences.append(confidence)
-                        self.plate_timestamps.append(timestamp)
-                        
-                        # Update plate data for API
-                        # Convert plate image to base64 for frontend
-                        _, buffer = cv2.imencode('.jpg', plate_img)
-                        img_str = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
-                        
-                        # Check if this plate is already in the list
-                        existing_plate = next((p for p in plate_data["plates"] if p["text"] == plate_text), None)
-                        
-                        if existing_plate:
-                            # Update existing plate with better confidence if applicable
-                            if confidence > existing_plate["confidence"]:
-                                existing_plate["confidence"] = float(confidence)
-                                existing_plate["image"] = img_str
-                                existing_plate["timestamp"] = timestamp
-                        else:
-                            # Add new plate
-                            plate_data["plates"].append({
-                                "text": plate_text,
-                                "confidence": float(confidence),
-                                "timestamp": timestamp,
-                                "image": img_str
-                            })
-            
-            # Convert the display frame to base64 for streaming
-            _, buffer = cv2.imencode('.jpg', display_frame)
-            frame_base64 = base64.b64encode(buffer).decode('utf-8')
-            plate_data["current_frame"] = f"data:image/jpeg;base64,{frame_base64}"
-            
-            # Check if processing should be stopped
-            if self.stop_flag:
-                break
+                    
+                    # Calculate absolute coordinates of the license plate in the original frame
+                    px, py, pw, ph = plate_coords
+                    abs_x = x1 + px
+                    abs_y = y1 + py
+                    if self.cache is not None and plate_text:
+                        self.cache.add_plate(frame_count, (abs_x, abs_y, abs_x + pw, abs_y + ph), plate_text, confidence)
+                    
+                    # Skip if no text is detected or confidence is too low
+                    if not plate_text or confidence < self.min_confidence:
+                        continue
+                    
+                    # Draw license plate bounding box on display frame (red)
+                    cv2.rectangle(display_frame, (abs_x, abs_y), (abs_x + pw, abs_y + ph), (0, 0, 255), 2)
+                    
+                    # Add text above the license plate
+                    cv2.putText(display_frame, plate_text, (abs_x, abs_y - 10), 
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
+                    
+                    # Save the detection
+                    self.plate_store.add(plate_text, confidence, timestamp, plate_img)
+                    
+                    # Update plate data for API
+                    # Convert plate image to base64 for frontend
+                    _, buffer = cv2.imencode('.jpg', plate_img)
+                    img_str = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+                    
+                    # Check if this plate is already in the list
+                    index = next((i for i, p in enumerate(self.plates) if p["text"] == plate_text), None)
+                    
+                    if index is not None:
+                        # Update existing plate with better confidence if applicable.
+                        # Entries are replaced, never mutated, since snapshots share them.
+                        if confidence > self.plates[index]["confidence"]:
+                            self.plates[index] = dict(
+                                self.plates[index],
+                                confidence=float(confidence),
+                                image=img_str,
+                                timestamp=timestamp
+                            )
+                    else:
+                        # Add new plate
+                        self.plates.append({
+                            "text": plate_text,
+                            "confidence": float(confidence),
+                            "timestamp": timestamp,
+                            "image": img_str
+                        })
+                        if len(self.plates) > MAX_LISTED_PLATES:
+                            del self.plates[0]
+                
+                if self.exporter is not None:
+                    # The encoder thread writes the frame; no preview is published
+                    with self.stages('export'):
+                        self.exporter.write(display_frame)
+                    current_frame = None
+                elif self.preview:
+                    # Convert the display frame to base64 for streaming
+                    with self.stages('encode'):
+                        _, buffer = cv2.imencode('.jpg', display_frame)
+                        frame_base64 = base64.b64encode(buffer).decode('utf-8')
+                    current_frame = f"data:image/jpeg;base64,{frame_base64}"
+                else:
+                    current_frame = None
+                plate_state.publish(
+                    plates=tuple(self.plates),
+                    current_frame=current_frame
+                )
+                
+                # Check if processing should be stopped
+                if self.stop_flag:
+                    break
+        finally:
+            # Release video capture
+            cap.release()
+            if self.exporter is not None:
+                self.exporter.close()
+            self.stages.finish()
         
-        # Release video capture
-        cap.release()
+        if self.cache is not None:
+            self.cache.close()
         
         # Save detections to Excel
         self.save_to_excel()
+        self.plate_store.flush()
         
         # Mark processing as complete
-        plate_data["processing_complete"] = True
+        plate_state.publish(processing_complete=True)
     
     def save_to_excel(self):
         """
         Save detected license plates to Excel file
         """
-        if not self.detected_plates:
+        if self.plate_store is None or not self.plate_store.detections:
             return
         
-        # Create DataFrame
+        # Create DataFrame from the detection log
         current_date = datetime.now().strftime("%Y-%m-%d")
-        data = {
-            "Date": [current_date] * len(self.detected_plates),
-            "License Plate": self.detected_plates,
-            "Confidence": self.plate_confidences,
-            "Timestamp (s)": self.plate_timestamps
-        }
-        
-        df = pd.DataFrame(data)
+        # Plates are text even when they look like numbers
+        df = pd.read_csv(self.plate_store.log_path, dtype={'License Plate': str})
+        df.insert(0, "Date", current_date)
         
         # Check if file exists
         if os.path.exists(self.excel_path):
@@ -303,4 +389,4 @@ def get_plate_data():
     """
     Return current plate data as JSON
     """
-    return plate_data
+    return plate_state.to_dict()
@@ -1,13 +1,15 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
+from inference_backend import Detector
+from stages import StageTimer
+from video_decoder import open_video
 
-def detect_and_count_people(video_path):
-    # Load YOLO model
-    model = YOLO('yolov8n.pt')
+def detect_and_count_people(video_path, backend=None, job_id=None, start=None, end=None):
+    # Load YOLO model (not shared, since tracking state persists on the model)
+    model = Detector('yolov8n.pt', backend).model
     
     # Initialize video capture
-    cap = cv2.VideoCapture(video_path)
+    cap = open_video(video_path, start=start, end=end)
     
     # Initialize counters
     total_count = 0
@@ -15,46 +17,53 @@ def detect_and_count_people(video_path):
     exiting_count = 0
     
     # Get video properties
-    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_width = cap.size[0]
     mid_line = frame_width // 2
     
     # Dictionary to track objects
     tracked_objects = {}
+    stages = StageTimer('people', job_id)
+    stages.start()
     
-    while cap.isOpened():
-        success, frame = cap.read()
-        if not success:
-            break
-            
-        # Run YOLOv8 tracking on the frame, persisting tracks between frames
-        results = model.track(frame, persist=True, classes=[0])  # class 0 is person
-        
-        if results and results[0].boxes.id is not None:
-            boxes = results[0].boxes.xyxy.cpu().numpy()
-            track_ids = results[0].boxes.id.cpu().numpy()
+    try:
+        while cap.isOpened():
+            stages.frame += 1
+            with stages('decode'):
+                success, frame = cap.read()
+            if not success:
+                break
+                
+            # Run YOLOv8 tracking on the frame, persisting tracks between frames
+            with stages('infer'):
+                results = model.track(frame, persist=True, classes=[0], verbose=False)  # class 0 is person
             
-            for box, track_id in zip(boxes, track_ids):
-                x1, y1, x2, y2 = box
-                center_x = (x1 + x2) / 2
+            if results and results[0].boxes.id is not None:
+                boxes = results[0].boxes.xyxy.cpu().numpy()
+                track_ids = results[0].boxes.id.cpu().numpy()
                 
-                if track_id not in tracked_objects:
-                    tracked_objects[track_id] = {
-                        'first_x': center_x,
-                        'counted': False
-                    }
-                elif not tracked_objects[track_id]['counted']:
-                    # Determine direction and count
-                    if tracked_objects[track_id]['first_x'] < mid_line and center_x > mid_line:
-                        entering_count += 1
-                        total_count += 1
-                        tracked_objects[track_id]['counted'] = True
-                    elif tracked_objects[track_id]['first_x'] > mid_line and center_x < mid_line:
-                        exiting_count += 1
-                        total_count += 1
-                        tracked_objects[track_id]['counted'] = True
-    
-    # Release resources
-    cap.release()
+                for box, track_id in zip(boxes, track_ids):
+                    x1, y1, x2, y2 = box
+                    center_x = (x1 + x2) / 2
+                    
+                    if track_id not in tracked_objects:
+                        tracked_objects[track_id] = {
+                            'first_x': center_x,
+                            'counted': False
+                        }
+                    elif not tracked_objects[track_id]['counted']:
+                        # Determine direction and count
+                        if tracked_objects[track_id]['first_x'] < mid_line and center_x > mid_line:
+                            entering_count += 1
+                            total_count += 1
+                            tracked_objects[track_id]['counted'] = True
+                        elif tracked_objects[track_id]['first_x'] > mid_line and center_x < mid_line:
+                            exiting_count += 1
+                            total_count += 1
+                            tracked_objects[track_id]['counted'] = True
+    finally:
+        # Release resources
+        cap.release()
+        stages.finish()
     
     return {
         'total': total_count,
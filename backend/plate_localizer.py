@@ -0,0 +1,99 @@
+import math
+import cv2
+import numpy as np
+
+# Plates sit in the lower part of a vehicle, so the search starts this far down the crop
+SEARCH_TOP = 0.35
+
+# The search band is downscaled to at most this width before any filtering
+SEARCH_WIDTH = 320
+
+# Plausible plate shape (width / height) and minimum size relative to the band
+MIN_ASPECT = 2.0
+MAX_ASPECT = 5.5
+MIN_AREA_FRACTION = 0.002
+
+def _search_band(vehicle_img):
+    """Lower region of the crop, downscaled; returns (band, top offset, scale)"""
+    h, w = vehicle_img.shape[:2]
+    top = int(h * SEARCH_TOP)
+    band = vehicle_img[top:]
+    scale = min(1.0, SEARCH_WIDTH / float(w))
+    if scale < 1.0:
+        band = cv2.resize(band, (max(1, int(round(w * scale))), max(1, int(round((h - top) * scale)))),
+                          interpolation=cv2.INTER_AREA)
+    return band, top, scale
+
+def _to_crop(rect, top, scale, shape):
+    """Map a band rectangle back to integer (x, y, w, h) in the original crop"""
+    x, y, w, h = rect
+    height, width = shape[:2]
+    x1 = max(0, int(math.floor(x / scale)))
+    y1 = max(0, int(math.floor(y / scale)) + top)
+    x2 = min(width, int(math.ceil((x + w) / scale)))
+    y2 = min(height, int(math.ceil((y + h) / scale)) + top)
+    return x1, y1, x2 - x1, y2 - y1
+
+def plate_candidates(vehicle_img):
+    """
+    Candidate plate rectangles, best first, as (x, y, w, h) in crop coordinates.
+    Dark characters on a light plate give a strong blackhat response with dense
+    vertical edges; closing that horizontally merges a plate into one blob.
+    """
+    band, top, scale = _search_band(vehicle_img)
+    gray = cv2.cvtColor(band, cv2.COLOR_BGR2GRAY)
+    bh, bw = gray.shape
+
+    blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, cv2.getStructuringElement(cv2.MORPH_RECT, (13, 5)))
+    grad = cv2.convertScaleAbs(cv2.Sobel(blackhat, cv2.CV_16S, 1, 0, ksize=3))
+    grad = cv2.GaussianBlur(grad, (5, 5), 0)
+    grad = cv2.morphologyEx(grad, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (17, 3)))
+    _, mask = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = MIN_AREA_FRACTION * bw * bh
+    candidates = []
+    for c in contours:
+        x, y, w, h = cv2.boundingRect(c)
+        if h == 0 or w * h < min_area:
+            continue
+        if MIN_ASPECT <= w / float(h) <= MAX_ASPECT:
+            # Prefer large, well-filled rectangles
+            fill = cv2.contourArea(c) / float(w * h)
+            candidates.append((w * h * fill, (x, y, w, h)))
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    return [_to_crop(rect, top, scale, vehicle_img.shape) for _, rect in candidates]
+
+def localize_plate(vehicle_img):
+    """Return (plate_img, (x, y, w, h)) of the best candidate, or (None, None)"""
+    for x, y, w, h in plate_candidates(vehicle_img):
+        if w > 0 and h > 0:
+            return vehicle_img[y:y+h, x:x+w], (x, y, w, h)
+    return None, None
+
+class PlateModelLocalizer:
+    """
+    Plate localization with a small plate-detector model, run as one batch over
+    all vehicle crops of a frame. The lower search band of each crop is what the
+    model sees; boxes are mapped back to the original crop.
+    """
+    def __init__(self, detector, min_confidence=0.25):
+        self.detector = detector
+        self.min_confidence = min_confidence
+
+    def localize_batch(self, vehicle_imgs):
+        """Return one (plate_img, (x, y, w, h)) or (None, None) per crop; plate_img is a view into the crop"""
+        bands = [_search_band(img) for img in vehicle_imgs]
+        results = self.detector.detect_batch([band for band, _, _ in bands])
+        located = []
+        for img, (band, top, scale), detections in zip(vehicle_imgs, bands, results):
+            detections = detections[detections[:, 4] >= self.min_confidence] if len(detections) else detections
+            if len(detections) == 0:
+                located.append((None, None))
+                continue
+            x1, y1, x2, y2 = detections[np.argmax(detections[:, 4]), :4]
+            x, y, w, h = _to_crop((x1, y1, x2 - x1, y2 - y1), top, scale, img.shape)
+            located.append((img[y:y+h, x:x+w], (x, y, w, h)) if w > 0 and h > 0 else (None, None))
+        return located
@@ -0,0 +1,60 @@
+import csv
+import os
+import re
+from collections import OrderedDict
+import cv2
+
+class PlateCropStore:
+    """
+    Bounded store of license plate crops.
+
+    Only the best_k highest-confidence crops of the max_plates most recently
+    seen plates stay in memory; every other crop is written to disk. Every
+    detection is appended to a CSV log instead of being kept in lists.
+    """
+    LOG_FIELDS = ['License Plate', 'Confidence', 'Timestamp (s)']
+
+    def __init__(self, directory, best_k=3, max_plates=200):
+        self.directory = directory
+        self.best_k = best_k
+        self.max_plates = max_plates
+        self.best = OrderedDict()
+        self.spilled = 0
+        self.detections = 0
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.log_path = os.path.join(directory, 'detections.csv')
+        with open(self.log_path, 'w', newline='') as f:
+            csv.writer(f).writerow(self.LOG_FIELDS)
+
+    def _spill(self, text, confidence, timestamp, img):
+        name = re.sub(r'[^A-Za-z0-9]+', '_', text) or 'plate'
+        path = os.path.join(self.directory, f"{name}_{timestamp:.2f}_{confidence:.2f}.jpg")
+        cv2.imwrite(path, img)
+        self.spilled += 1
+
+    def add(self, text, confidence, timestamp, img):
+        """Record a detection, keeping its crop in memory only if it is among the best"""
+        self.detections += 1
+        with open(self.log_path, 'a', newline='') as f:
+            csv.writer(f).writerow([text, float(confidence), float(timestamp)])
+
+        crops = self.best.pop(text, [])
+        self.best[text] = crops
+        # Plate images are views into the decoder's reused frame buffers
+        crops.append((float(confidence), float(timestamp), img.copy()))
+        crops.sort(key=lambda c: c[0], reverse=True)
+        while len(crops) > self.best_k:
+            self._spill(text, *crops.pop())
+
+        while len(self.best) > self.max_plates:
+            old_text, old_crops = self.best.popitem(last=False)
+            for crop in old_crops:
+                self._spill(old_text, *crop)
+
+    def flush(self):
+        """Write the in-memory crops to disk and release them"""
+        for text, crops in self.best.items():
+            for crop in crops:
+                self._spill(text, *crop)
+        self.best.clear()
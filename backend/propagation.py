@@ -0,0 +1,123 @@
+from contextlib import nullcontext
+import cv2
+import numpy as np
+from roi import detect_in_roi
+
+# Optical flow runs on frames downscaled to this width
+FLOW_WIDTH = 480
+
+class BoxPropagator:
+    """
+    Carries detections forward between detector runs with sparse Lucas-Kanade
+    optical flow: each box moves by the median motion of the corners inside it.
+    """
+    def __init__(self, points_per_box=12, flow_width=FLOW_WIDTH):
+        self.points_per_box = points_per_box
+        self.flow_width = flow_width
+        self.scale = 1.0
+        self.prev = None
+        self.detections = np.zeros((0, 6), np.float32)
+        self.points = []
+
+    def prepare(self, frame):
+        """Downscaled grayscale frame used for flow and scene-change checks"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape
+        self.scale = min(1.0, self.flow_width / float(w))
+        if self.scale < 1.0:
+            gray = cv2.resize(gray, (int(w * self.scale), int(h * self.scale)), interpolation=cv2.INTER_AREA)
+        return gray
+
+    def _seed(self, gray):
+        """Pick trackable corners inside every box"""
+        self.points = []
+        for det in self.detections:
+            x1, y1, x2, y2 = (det[:4] * self.scale).astype(int)
+            mask = np.zeros_like(gray)
+            mask[max(0, y1):max(0, y2), max(0, x1):max(0, x2)] = 255
+            corners = cv2.goodFeaturesToTrack(gray, self.points_per_box, 0.01, 3, mask=mask)
+            self.points.append(corners if corners is not None else np.zeros((0, 1, 2), np.float32))
+
+    def reset(self, gray, detections):
+        """Start propagating from fresh detector output on a prepared frame"""
+        self.prev = gray
+        self.detections = np.array(detections, np.float32).reshape(-1, 6)
+        self._seed(gray)
+
+    def propagate(self, gray):
+        """Return the detections moved to a prepared frame"""
+        if self.prev is None or len(self.detections) == 0:
+            self.prev = gray
+            return self.detections
+
+        counts = [len(p) for p in self.points]
+        if sum(counts):
+            points = np.concatenate([p for p in self.points if len(p)])
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(self.prev, gray, points, None,
+                                                       winSize=(15, 15), maxLevel=2)
+            start = 0
+            for i, count in enumerate(counts):
+                if not count:
+                    continue
+                ok = status[start:start + count, 0] == 1
+                if ok.any():
+                    shift = np.median((moved[start:start + count] - points[start:start + count])[ok], axis=0)[0]
+                    self.detections[i, [0, 2]] += shift[0] / self.scale
+                    self.detections[i, [1, 3]] += shift[1] / self.scale
+                    self.points[i] = moved[start:start + count][ok].reshape(-1, 1, 2)
+                start += count
+
+        self.prev = gray
+        return self.detections.copy()
+
+    def scene_change(self, gray, reference):
+        """Mean absolute difference between two prepared frames"""
+        if reference is None or gray.shape != reference.shape:
+            return float('inf')
+        return float(cv2.absdiff(gray, reference).mean())
+
+class DetectThenTrack:
+    """
+    Runs the detector every detect_every frames (or early on a scene change)
+    and propagates its boxes with optical flow on the frames in between.
+    With detect_every=1 it is a plain detector call.
+    """
+    def __init__(self, detector, roi=None, classes=None, detect_every=1, scene_threshold=None, stages=None):
+        self.detector = detector
+        self.roi = roi
+        self.classes = classes
+        self.detect_every = max(1, int(detect_every))
+        self.scene_threshold = scene_threshold
+        self.stages = stages
+        self.propagator = BoxPropagator()
+        self.since_detect = None
+        self.keyframe = None
+
+    def _stage(self, name):
+        return self.stages(name) if self.stages is not None else nullcontext()
+
+    def __call__(self, frame):
+        """Return (detections, ran_detector) for a frame"""
+        if self.detect_every == 1:
+            with self._stage('infer'):
+                return detect_in_roi(self.detector, frame, self.roi, self.classes), True
+
+        with self._stage('propagate'):
+            gray = self.propagator.prepare(frame)
+            due = self.since_detect is None or self.since_detect + 1 >= self.detect_every
+            if not due and self.scene_threshold is not None:
+                due = self.propagator.scene_change(gray, self.keyframe) > self.scene_threshold
+
+        if due:
+            with self._stage('infer'):
+                detections = detect_in_roi(self.detector, frame, self.roi, self.classes)
+            with self._stage('propagate'):
+                self.propagator.reset(gray, detections)
+            self.keyframe = gray
+            self.since_detect = 0
+            return detections, True
+
+        with self._stage('propagate'):
+            detections = self.propagator.propagate(gray)
+        self.since_detect += 1
+        return detections, False
@@ -0,0 +1,158 @@
+"""
+CPU budgets for concurrent analyzer jobs.
+
+Every analyzer runs PyTorch (and EasyOCR on PyTorch) and OpenCV with thread
+pools sized to the whole machine, so three concurrent jobs run three times as
+many compute threads as there are cores. The ResourceManager splits the
+available cores between the running jobs by weight and rebalances whenever a
+job starts or ends.
+
+The PyTorch and OpenCV thread counts are process-wide, so within one process
+they cannot differ per job: both are set to the cores divided by the number of
+running jobs. The weighted core lists only take effect with pinning, where each
+job's thread is bound to its cores at its next stage (new compute threads
+inherit that, already running pool threads do not). Jobs that need strict
+per-job budgets run in separate processes (batch.py, job_worker.py), which
+size their pools once at start.
+"""
+import os
+import threading
+import cv2
+import stages
+
+# Set to 0 to leave thread pools at their defaults
+CPU_BUDGET = os.environ.get('SENTINEL_CPU_BUDGET', '1') == '1'
+
+# Pin each job's thread to its budget's cores (Linux only)
+CPU_PIN = os.environ.get('SENTINEL_CPU_PIN', '0') == '1'
+
+# Relative share of the cores per analyzer; plate jobs also run OCR
+ANALYZER_WEIGHTS = {'counter': 1, 'mask': 1, 'people': 1, 'plate': 2}
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def allocate(cores, weights):
+    """
+    Split cores between jobs in proportion to their weights, as contiguous core
+    lists, at least one core each. With more jobs than cores, jobs share cores.
+    """
+    if not weights:
+        return []
+    if len(weights) >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(len(weights))]
+
+    spare = len(cores) - len(weights)
+    total = float(sum(weights))
+    shares = [spare * w / total for w in weights]
+    counts = [1 + int(s) for s in shares]
+    # Hand out the cores left by rounding down to the largest remainders
+    leftover = len(cores) - sum(counts)
+    for i in sorted(range(len(weights)), key=lambda i: shares[i] - int(shares[i]), reverse=True)[:leftover]:
+        counts[i] += 1
+
+    budgets = []
+    start = 0
+    for count in counts:
+        budgets.append(cores[start:start + count])
+        start += count
+    return budgets
+
+class ResourceManager:
+    """Assigns per-job core budgets as jobs start and finish"""
+    def __init__(self, cores=None, pin=CPU_PIN, weights=None):
+        self.cores = sorted(cores) if cores else available_cores()
+        self.pin = pin and hasattr(os, 'sched_setaffinity')
+        self.weights = weights or ANALYZER_WEIGHTS
+        self.lock = threading.Lock()
+        # job id -> analyzer, in start order
+        self.jobs = {}
+        self.budgets = {}
+        self.applied = {}
+        self.threads = len(self.cores)
+
+    def budget(self, job_id):
+        """Cores currently assigned to a job"""
+        with self.lock:
+            return list(self.budgets.get(job_id, self.cores))
+
+    def _rebalance(self):
+        job_ids = list(self.jobs)
+        budgets = allocate(self.cores, [self.weights.get(self.jobs[j], 1) for j in job_ids])
+        self.budgets = {job_id: tuple(cores) for job_id, cores in zip(job_ids, budgets)}
+        self.threads = max(1, len(self.cores) // max(1, len(job_ids)))
+
+    def on_job(self, timer, event):
+        """Job listener: rebalance on start and end"""
+        if event == 'cancel':
+            return
+        with self.lock:
+            if event == 'start':
+                self.jobs[timer.job_id] = timer.analyzer
+            else:
+                self.jobs.pop(timer.job_id, None)
+                self.applied.pop(timer.job_id, None)
+            self._rebalance()
+            threads = self.threads
+        self._set_pool_threads(threads)
+        if event == 'start':
+            self.apply(timer.job_id)
+        elif self.pin:
+            # Worker threads may run another job next; give them every core back
+            os.sched_setaffinity(0, self.cores)
+
+    def on_stage(self, timer, stage, start, end):
+        """Stage listener: runs on the job's thread, where its cores have to be pinned"""
+        if self.pin and self.budgets.get(timer.job_id) != self.applied.get(timer.job_id):
+            self.apply(timer.job_id)
+
+    def apply(self, job_id):
+        """Pin the calling thread to a job's cores (when pinning)"""
+        if not self.pin:
+            return
+        with self.lock:
+            cores = self.budgets.get(job_id)
+            if cores is None:
+                return
+            self.applied[job_id] = cores
+        # 0 is the calling thread on Linux
+        os.sched_setaffinity(0, cores)
+
+    def _set_pool_threads(self, threads):
+        """Size the process-wide PyTorch and OpenCV thread pools"""
+        import torch
+        torch.set_num_threads(threads)
+        cv2.setNumThreads(threads)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'cores': len(self.cores),
+                'pin': self.pin,
+                'threads_per_job': self.threads,
+                'jobs': {job_id: {'analyzer': analyzer, 'cores': list(self.budgets.get(job_id, ()))}
+                         for job_id, analyzer in self.jobs.items()}
+            }
+
+_manager = None
+
+def install(cores=None, pin=CPU_PIN):
+    """Start managing CPU budgets of the analyzer jobs in this process"""
+    global _manager
+    if _manager is None:
+        _manager = ResourceManager(cores, pin)
+        stages.add_job_listener(_manager.on_job)
+        stages.add_listener(_manager.on_stage)
+    return _manager
+
+def uninstall():
+    global _manager
+    if _manager is not None:
+        stages.remove_job_listener(_manager.on_job)
+        stages.remove_listener(_manager.on_stage)
+        _manager = None
+
+def get_manager():
+    return _manager
@@ -0,0 +1,91 @@
+import json
+import math
+import numpy as np
+
+class ROI:
+    """
+    Rectangular region of interest. Frames are cropped to it before inference
+    and detections are mapped back to full-frame coordinates.
+    """
+    def __init__(self, x1, y1, x2, y2):
+        self.x1 = int(x1)
+        self.y1 = int(y1)
+        self.x2 = int(x2)
+        self.y2 = int(y2)
+        if self.x2 <= self.x1 or self.y2 <= self.y1:
+            raise ValueError(f"Empty region of interest: {self.as_tuple()}")
+
+    @classmethod
+    def from_zones(cls, zones, margin=0):
+        """
+        Bounding box of the union of polygon zones, grown by a margin.
+        margin is a single value or (left, top, right, bottom).
+        """
+        if isinstance(margin, (int, float)):
+            margin = (margin, margin, margin, margin)
+        points = np.array([p for zone in zones for p in zone], np.int32)
+        x1, y1 = points.min(axis=0)
+        x2, y2 = points.max(axis=0)
+        left, top, right, bottom = margin
+        return cls(x1 - left, y1 - top, x2 + right, y2 + bottom)
+
+    def clip(self, width, height):
+        """Return the region clipped to a width x height frame"""
+        return ROI(max(0, self.x1), max(0, self.y1), min(width, self.x2), min(height, self.y2))
+
+    @property
+    def width(self):
+        return self.x2 - self.x1
+
+    @property
+    def height(self):
+        return self.y2 - self.y1
+
+    def as_tuple(self):
+        return (self.x1, self.y1, self.x2, self.y2)
+
+    def crop(self, frame):
+        """Crop a frame to the region (a view, no copy)"""
+        h, w = frame.shape[:2]
+        r = self.clip(w, h)
+        return frame[r.y1:r.y2, r.x1:r.x2], (r.x1, r.y1)
+
+    def inference_size(self, scale=1.0, stride=32):
+        """Inference size that keeps the region at the given scale"""
+        side = max(self.width, self.height) * scale
+        return max(stride, int(math.ceil(side / stride)) * stride)
+
+def to_frame(detections, offset):
+    """Shift (N, 6) crop detections back to full-frame coordinates"""
+    if len(detections) == 0 or offset == (0, 0):
+        return detections
+    detections = detections.copy()
+    detections[:, [0, 2]] += offset[0]
+    detections[:, [1, 3]] += offset[1]
+    return detections
+
+def detect_in_roi(detector, frame, roi, classes=None):
+    """Run a detector on the ROI crop of a frame, returning full-frame boxes"""
+    if roi is None:
+        return detector.detect(frame, classes)
+    crop, offset = roi.crop(frame)
+    return to_frame(detector.detect(crop, classes), offset)
+
+def parse_roi(value, margin=0):
+    """
+    Parse an ROI from an API parameter: either "x1,y1,x2,y2" or a JSON list
+    of polygons whose union (plus margin) becomes the region.
+    Returns None for an empty value or "full".
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if not value or value == 'full':
+        return None
+    if value.startswith('['):
+        zones = json.loads(value)
+        if zones and isinstance(zones[0][0], (int, float)):
+            zones = [zones]
+        return ROI.from_zones(zones, margin)
+    x1, y1, x2, y2 = (int(float(v)) for v in value.split(','))
+    return ROI(x1, y1, x2, y2)
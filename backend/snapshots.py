@@ -0,0 +1,77 @@
+import json
+import threading
+import uuid
+from types import MappingProxyType
+
+class SnapshotStore:
+    """
+    Live analyzer state published as immutable, versioned snapshots.
+
+    Analyzers replace the whole state with publish(); readers get a consistent
+    snapshot without locking, can wait for the next version (long-poll) and
+    share one JSON serialization per version. Versions restart with the
+    process, so they are only comparable within the same epoch.
+    """
+    def __init__(self, initial, serialize=None):
+        self.epoch = uuid.uuid4().hex[:12]
+        self._cond = threading.Condition()
+        self._version = 1
+        self._data = MappingProxyType(dict(initial))
+        self._serialize = serialize
+        self._json = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def snapshot(self):
+        """Return (version, read-only mapping) of the current state"""
+        with self._cond:
+            return self._version, self._data
+
+    def get(self):
+        return self.snapshot()[1]
+
+    def publish(self, **changes):
+        """Publish a new version with the given keys replaced"""
+        with self._cond:
+            data = dict(self._data)
+            data.update(changes)
+            self._data = MappingProxyType(data)
+            self._version += 1
+            self._json = None
+            self._cond.notify_all()
+            return self._version
+
+    def reset(self, initial):
+        """Publish a new version that replaces the whole state"""
+        with self._cond:
+            self._data = MappingProxyType(dict(initial))
+            self._version += 1
+            self._json = None
+            self._cond.notify_all()
+            return self._version
+
+    def wait(self, version, timeout=None):
+        """Block until the state is newer than version (or timeout); return the current version"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._version > version, timeout)
+            return self._version
+
+    def to_dict(self, data=None):
+        """Serializable copy of a snapshot"""
+        data = self.get() if data is None else data
+        return self._serialize(data) if self._serialize else dict(data)
+
+    def json(self):
+        """Return (version, JSON bytes) of the current state, serialized once per version"""
+        with self._cond:
+            cached = self._json
+            version, data = self._version, self._data
+        if cached is not None and cached[0] == version:
+            return cached
+        body = json.dumps(self.to_dict(data)).encode('utf-8')
+        with self._cond:
+            if self._version == version:
+                self._json = (version, body)
+        return version, body
@@ -0,0 +1,79 @@
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+# Per-job output (traces, exports, caches) lives in a directory per job id
+RESULTS_FOLDER = os.path.join('uploads', 'results')
+
+# Callables invoked as listener(timer, stage, start, end) for every timed stage
+_listeners = []
+
+# Callables invoked as listener(timer, event) when a job starts ('start') or ends ('end'),
+# or gives up before starting ('cancel')
+_job_listeners = []
+
+def add_listener(listener):
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+def add_job_listener(listener):
+    if listener not in _job_listeners:
+        _job_listeners.append(listener)
+
+def remove_job_listener(listener):
+    if listener in _job_listeners:
+        _job_listeners.remove(listener)
+
+def new_job_id():
+    return uuid.uuid4().hex[:12]
+
+def results_dir(job_id, create=True):
+    """Return the results directory of a job"""
+    path = os.path.join(RESULTS_FOLDER, job_id)
+    if create and not os.path.exists(path):
+        os.makedirs(path)
+    return path
+
+class StageTimer:
+    """
+    Times the pipeline stages (decode, infer, track, ocr, annotate, encode, ...)
+    of one analyzer run and reports them to the registered listeners.
+    Timing is skipped entirely while no listener is registered.
+    """
+    def __init__(self, analyzer, job_id=None):
+        self.analyzer = analyzer
+        self.job_id = job_id or new_job_id()
+        self.frame = 0
+
+    def start(self):
+        """Signal that the analyzer run has started"""
+        for listener in list(_job_listeners):
+            listener(self, 'start')
+
+    def finish(self):
+        """Signal that the analyzer run has ended"""
+        for listener in list(_job_listeners):
+            listener(self, 'end')
+
+    def cancel(self):
+        """Signal that the analyzer run ended before it started (e.g. an unreadable video)"""
+        for listener in list(_job_listeners):
+            listener(self, 'cancel')
+
+    @contextmanager
+    def __call__(self, stage):
+        if not _listeners:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            for listener in list(_listeners):
+                listener(self, stage, start, end)
@@ -0,0 +1,67 @@
+import importlib
+import io
+import os
+import pytest
+
+for module in ('flask', 'flask_cors', 'numpy', 'cv2', 'ultralytics', 'easyocr', 'pandas'):
+    pytest.importorskip(module)
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # The app creates its upload folder and databases relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('SENTINEL_CPU_BUDGET', '0')
+    module = importlib.import_module('app')
+    return module
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+def test_etag_carries_epoch_and_version(app, client):
+    response = client.get('/api/count-data')
+    assert response.status_code == 200
+    store = app.count_state
+    assert response.headers['ETag'] == f'"{store.epoch}-{store.version}"'
+
+def test_if_none_match_gives_304_until_published(app, client):
+    etag = client.get('/api/count-data').headers['ETag']
+    assert client.get('/api/count-data', headers={'If-None-Match': etag}).status_code == 304
+    app.count_state.publish(entering=1)
+    response = client.get('/api/count-data', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_etag_from_another_epoch_is_not_matched(app, client):
+    version = app.count_state.version
+    response = client.get('/api/count-data', headers={'If-None-Match': f'"0-{version}"'})
+    assert response.status_code == 200
+
+def test_wait_from_another_epoch_returns_at_once(app, client):
+    response = client.get('/api/count-data', query_string={'wait': f'"0-{app.count_state.version}"',
+                                                           'timeout': 30})
+    assert response.status_code == 200
+
+def test_wait_times_out_with_current_state(app, client):
+    etag = client.get('/api/count-data').headers['ETag']
+    response = client.get('/api/count-data', query_string={'wait': etag, 'timeout': 0.01})
+    assert response.headers['ETag'] == etag
+
+def test_malformed_wait_is_rejected(client):
+    assert client.get('/api/count-data', query_string={'wait': 'latest'}).status_code == 400
+    assert client.get('/api/count-data', query_string={'wait': 1, 'timeout': 'soon'}).status_code == 400
+
+def test_malformed_count_range_is_rejected(client):
+    assert client.get('/api/counts/range', query_string={'start': 'yesterday'}).status_code == 400
+    assert client.get('/api/counts/range', query_string={'end': 'nan'}).status_code == 400
+
+def test_unknown_backend_is_rejected(client, tmp_path):
+    data = {'video': (io.BytesIO(b'not a video'), 'clip.mp4'), 'backend': 'tensorrt'}
+    response = client.post('/api/start-counting', data=data, content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert 'tensorrt' in response.get_json()['error']
+    assert not os.path.exists(tmp_path / 'uploads' / 'clip.mp4')
+
+def test_reanalyze_rejects_non_object_body(client):
+    response = client.post('/api/reanalyze/missing', json=['areas'])
+    assert response.status_code == 400
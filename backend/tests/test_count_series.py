@@ -0,0 +1,77 @@
+import time
+import pytest
+import count_series
+from count_series import CountSeries, ENTERING, EXITING
+
+@pytest.fixture
+def series(tmp_path):
+    return CountSeries(str(tmp_path / 'counts.db'))
+
+def test_rollups_aggregate_per_bucket(series):
+    base = 7200.0
+    for offset, direction in [(0.2, ENTERING), (0.7, ENTERING), (1.5, EXITING), (61, ENTERING), (3700, EXITING)]:
+        series.record('door', base + offset, direction)
+    series.flush()
+
+    seconds = series.range('door', base, base + 120, '1s')
+    assert [(b['t'], b['entering'], b['exiting']) for b in seconds['buckets']] == [
+        (7200, 2, 0), (7201, 0, 1), (7261, 1, 0)]
+    assert [b['net'] for b in seconds['buckets']] == [2, 1, 2]
+
+    minutes = series.range('door', base, base + 7200, '1m')
+    assert [(b['t'], b['entering'], b['exiting']) for b in minutes['buckets']] == [
+        (7200, 2, 1), (7260, 1, 0), (10860, 0, 1)]
+
+    hours = series.range('door', base, base + 7200, '1h')
+    assert [(b['t'], b['entering'], b['exiting']) for b in hours['buckets']] == [(7200, 3, 1), (10800, 0, 1)]
+    assert (hours['entering'], hours['exiting']) == (3, 2)
+
+def test_flushes_add_to_existing_buckets(series):
+    series.record('door', 100.1, ENTERING)
+    series.flush()
+    series.record('door', 100.9, ENTERING)
+    series.flush()
+    assert series.range('door', 100, 101, '1s')['buckets'][0]['entering'] == 2
+
+def test_sources_are_kept_apart(series):
+    series.record('a', 10, ENTERING)
+    series.record('b', 10, EXITING)
+    series.flush()
+    assert sorted(series.sources()) == ['a', 'b']
+    assert series.range('a', 0, 60, '1s')['exiting'] == 0
+
+def test_resolution_is_picked_from_the_span(series):
+    assert series.pick_resolution(0, 600) == '1s'
+    assert series.pick_resolution(0, 86400) == '1m'
+    assert series.pick_resolution(0, 86400 * 30) == '1h'
+    with pytest.raises(ValueError):
+        series.range('door', 0, 10, '5m')
+
+def test_record_flushes_when_buffer_is_full(series, monkeypatch):
+    monkeypatch.setattr(count_series, 'FLUSH_EVENTS', 3)
+    for i in range(3):
+        series.record('door', 10 + i, ENTERING)
+    assert not series.pending
+    assert series.timer is None
+
+def test_single_crossing_is_flushed_by_the_timer(series, monkeypatch):
+    monkeypatch.setattr(count_series, 'FLUSH_SECONDS', 0.05)
+    series.record('door', 10, ENTERING)
+    assert len(series.pending) == 1
+    # Read the table directly; range() would flush by itself
+    db = series._connect()
+    try:
+        deadline = time.time() + 5
+        while not db.execute("SELECT COUNT(*) FROM events").fetchone()[0] and time.time() < deadline:
+            time.sleep(0.01)
+        assert db.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 1
+    finally:
+        db.close()
+    assert not series.pending
+
+def test_queries_see_pending_crossings(series):
+    series.record('door', 10, ENTERING)
+    assert series.pending
+    assert series.range('door', 0, 60, '1s')['entering'] == 1
+    assert series.sources() == ['door']
+    assert series.timer is None
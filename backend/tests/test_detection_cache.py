@@ -0,0 +1,111 @@
+import os
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from detection_cache import DetectionCacheWriter, DetectionCache, check_areas, check_classes, replay_plates, replay_counter
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+AREA2 = [[100, 0], [190, 0], [190, 100], [100, 100]]
+AREA1 = [[210, 0], [300, 0], [300, 100], [210, 100]]
+
+def person(x4, y4, cls=0):
+    return [x4 - 20, y4 - 40, x4, y4, 0.9, cls]
+
+def write_walk(directory, xs, cls=0, roi=None):
+    """Cache one person whose box corner walks along xs, one frame per step"""
+    writer = DetectionCacheWriter(str(directory), {'analyzer': 'counter', 'roi': roi,
+                                                   'areas': [AREA1, AREA2], 'classes': ['person']})
+    for frame, x in enumerate(xs, 1):
+        writer.add_frame(frame, frame / 25.0, np.array([person(x, 50, cls)], np.float32))
+    writer.close()
+    return DetectionCache(str(directory))
+
+def test_round_trip(tmp_path):
+    writer = DetectionCacheWriter(str(tmp_path), {'analyzer': 'plate', 'fps': 25.0})
+    writer.add_frame(3, 0.12, np.array([[1, 2, 3, 4, 0.5, 2], [5, 6, 7, 8, 0.6, 7]], np.float32))
+    writer.add_frame(6, 0.24, np.zeros((0, 6), np.float32))
+    writer.add_frame(9, 0.36, np.array([[9, 9, 19, 19, 0.7, 3]], np.float32))
+    writer.add_plate(3, (1, 2, 3, 4), 'AB123', 0.8)
+    writer.close()
+
+    cache = DetectionCache(str(tmp_path))
+    assert cache.meta['fps'] == 25.0
+    assert len(cache) == 3
+    frames = list(cache)
+    assert [(f, round(t, 2), len(d)) for f, t, d in frames] == [(3, 0.12, 2), (6, 0.24, 0), (9, 0.36, 1)]
+    assert frames[0][2][1].tolist() == pytest.approx([5, 6, 7, 8, 0.6, 7])
+    assert cache.plate_text == ['AB123']
+    assert cache.plate_boxes.tolist() == [[1, 2, 3, 4]]
+
+def test_unfinished_cache_is_not_loaded(tmp_path):
+    writer = DetectionCacheWriter(str(tmp_path), {'analyzer': 'counter'})
+    writer.add_frame(1, 0.0, np.zeros((0, 6), np.float32))
+    with pytest.raises(FileNotFoundError):
+        DetectionCache(str(tmp_path))
+
+def test_replay_plates_applies_new_cutoff(tmp_path):
+    writer = DetectionCacheWriter(str(tmp_path), {'analyzer': 'plate'})
+    for frame in (3, 6):
+        writer.add_frame(frame, frame / 10.0, np.zeros((0, 6), np.float32))
+    writer.add_plate(3, (0, 0, 1, 1), 'AB123', 0.4)
+    writer.add_plate(6, (0, 0, 1, 1), 'AB123', 0.6)
+    writer.add_plate(6, (0, 0, 1, 1), 'XY9', 0.2)
+    writer.close()
+    cache = DetectionCache(str(tmp_path))
+
+    results = replay_plates(cache, 0.5)
+    assert results['plates'] == [{'text': 'AB123', 'confidence': pytest.approx(0.6), 'detections': 1,
+                                  'timestamp': pytest.approx(0.6)}]
+    results = replay_plates(cache, 0.1)
+    assert sorted(p['text'] for p in results['plates']) == ['AB123', 'XY9']
+    assert results['detections'] == 3
+
+def test_check_areas():
+    check_areas([AREA1, AREA2], [100, 0, 300, 100])
+    check_areas([AREA1, AREA2], None)
+    with pytest.raises(ValueError):
+        check_areas([AREA1], None)
+    with pytest.raises(ValueError):
+        check_areas([AREA1, [[0, 0], [1, 1]]], None)
+    with pytest.raises(ValueError):
+        check_areas([AREA1, AREA2], [150, 0, 300, 100])
+
+def test_check_classes():
+    check_classes(['person', 'car'], ['person', 'bicycle', 'car'])
+    for classes in ('person', [], ['truck'], [1], {'person': 1}):
+        with pytest.raises(ValueError):
+            check_classes(classes, ['person', 'bicycle', 'car'])
+
+@pytest.fixture
+def replay_env(monkeypatch):
+    pytest.importorskip('cv2')
+    # Class names are read from coco.txt in the working directory
+    monkeypatch.chdir(BACKEND)
+
+def test_replay_counts_entering(tmp_path, replay_env):
+    cache = write_walk(tmp_path, range(150, 260, 10))
+    assert replay_counter(cache) == {'entering': 1, 'exiting': 0, 'frames': 11}
+
+def test_replay_counts_exiting(tmp_path, replay_env):
+    cache = write_walk(tmp_path, range(250, 140, -10))
+    assert replay_counter(cache) == {'entering': 0, 'exiting': 1, 'frames': 11}
+
+def test_replay_with_new_zones_and_classes(tmp_path, replay_env):
+    cache = write_walk(tmp_path, range(150, 260, 10), cls=2)
+    assert replay_counter(cache)['entering'] == 0
+    # Zones swapped: the same walk now exits
+    assert replay_counter(cache, [AREA2, AREA1], ['car']) == {'entering': 0, 'exiting': 1, 'frames': 11}
+
+def test_replay_rejects_zones_outside_cached_roi(tmp_path, replay_env):
+    cache = write_walk(tmp_path, range(150, 260, 10), roi=[150, 0, 300, 100])
+    with pytest.raises(ValueError):
+        replay_counter(cache, [AREA1, AREA2])
+
+def test_replay_rejects_unknown_classes(tmp_path, replay_env):
+    cache = write_walk(tmp_path, range(150, 260, 10))
+    with pytest.raises(ValueError):
+        replay_counter(cache, classes='person')
+    with pytest.raises(ValueError):
+        replay_counter(cache, classes=['pedestrian'])
@@ -0,0 +1,51 @@
+import os
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import inference_pool
+from inference_pool import InferencePool
+
+def fake_worker(index, ring_name, slots, slot_bytes, tasks, results, current, threads):
+    """Worker that returns no detections, or dies on frames whose classes are 'crash'"""
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        request_id, key, descriptor, classes = task
+        current[index] = request_id
+        if classes == 'crash':
+            os._exit(3)
+        results.put((request_id, np.zeros((0, 6), np.float32), None))
+        current[index] = -1
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(inference_pool, '_worker_main', fake_worker)
+    monkeypatch.setattr(inference_pool, 'LIVENESS_INTERVAL', 0.05)
+    pool = InferencePool(1, slots=2, slot_bytes=1024)
+    yield pool
+    pool.close()
+
+def test_detect_round_trip(pool):
+    frame = np.zeros((8, 8, 3), np.uint8)
+    assert [len(d) for d in pool.detect_batch('key', [frame, frame, frame])] == [0, 0, 0]
+    assert pool.ring.in_flight() == 0
+
+def test_dead_worker_fails_its_request_and_is_replaced(pool):
+    frame = np.zeros((8, 8, 3), np.uint8)
+    dead = pool.processes[0]
+    with pytest.raises(RuntimeError, match='exited with code 3'):
+        pool.detect('key', frame, 'crash')
+    assert not dead.is_alive()
+    assert pool.ring.in_flight() == 0
+    # The replacement worker serves the next frames
+    assert len(pool.detect('key', frame)) == 0
+    assert pool.processes[0] is not dead
+
+def test_submit_times_out_without_free_slots(pool, monkeypatch):
+    monkeypatch.setattr(inference_pool, 'RESULT_TIMEOUT', 0.05)
+    pool.ring.acquire()
+    pool.ring.acquire()
+    with pytest.raises(inference_pool.TimeoutError):
+        pool.submit('key', np.zeros((8, 8, 3), np.uint8))
@@ -0,0 +1,127 @@
+import os
+import time
+import pytest
+from job_queue import JobQueue, QUEUED, RUNNING, DONE, FAILED
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.db'))
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / 'upload.mp4'
+    path.write_bytes(b'video')
+    return str(path)
+
+def test_lease_takes_highest_priority_first(queue):
+    low = queue.enqueue('counter', 'a.mp4')
+    high = queue.enqueue('counter', 'b.mp4', priority=5)
+    assert queue.lease('w1')['id'] == high
+    assert queue.lease('w2')['id'] == low
+    assert queue.lease('w3') is None
+
+def test_lease_marks_running_and_counts_attempts(queue):
+    job_id = queue.enqueue('plate', 'a.mp4', {'backend': 'onnx'})
+    job = queue.lease('w1')
+    assert job['status'] == RUNNING
+    assert job['lease_owner'] == 'w1'
+    assert job['attempts'] == 1
+    assert job['options'] == {'backend': 'onnx'}
+    assert queue.complete(job_id, 'w1', {'plates': []})
+    assert queue.get(job_id)['status'] == DONE
+    assert queue.get(job_id)['result'] == {'plates': []}
+
+def test_failed_job_is_retried_after_backoff(queue):
+    job_id = queue.enqueue('counter', 'a.mp4')
+    queue.lease('w1')
+    assert queue.fail(job_id, 'w1', 'boom', retry_delay=0.2)
+    job = queue.get(job_id)
+    assert job['status'] == QUEUED
+    assert job['error'] == 'boom'
+    assert queue.lease('w1') is None
+    time.sleep(0.25)
+    assert queue.lease('w1')['attempts'] == 2
+
+def test_job_fails_for_good_after_max_attempts(queue):
+    job_id = queue.enqueue('counter', 'a.mp4', max_attempts=2)
+    for _ in range(2):
+        assert queue.lease('w1')['id'] == job_id
+        queue.fail(job_id, 'w1', 'boom', retry_delay=0)
+    assert queue.get(job_id)['status'] == FAILED
+    assert queue.lease('w1') is None
+
+def test_expired_lease_goes_back_to_the_queue(queue):
+    job_id = queue.enqueue('counter', 'a.mp4')
+    queue.lease('w1', lease_seconds=-1)
+    job = queue.lease('w2')
+    assert job['id'] == job_id
+    assert job['attempts'] == 2
+    # The first worker lost its lease and cannot report any more
+    assert not queue.heartbeat(job_id, 'w1')
+    assert not queue.complete(job_id, 'w1', {})
+    assert queue.heartbeat(job_id, 'w2')
+
+def test_expired_lease_on_last_attempt_fails(queue):
+    job_id = queue.enqueue('counter', 'a.mp4', max_attempts=1)
+    queue.lease('w1', lease_seconds=-1)
+    assert queue.lease('w2') is None
+    job = queue.get(job_id)
+    assert job['status'] == FAILED
+    assert job['error'] == 'lease expired'
+
+def test_cleanup_video_is_deleted_when_done(queue, video):
+    job_id = queue.enqueue('counter', video, {'cleanup': True})
+    queue.lease('w1')
+    queue.complete(job_id, 'w1', {})
+    assert not os.path.exists(video)
+
+def test_cleanup_video_is_kept_for_retries_and_deleted_on_final_failure(queue, video):
+    job_id = queue.enqueue('counter', video, {'cleanup': True}, max_attempts=2)
+    queue.lease('w1')
+    queue.fail(job_id, 'w1', 'boom', retry_delay=0)
+    assert os.path.exists(video)
+    queue.lease('w1')
+    queue.fail(job_id, 'w1', 'boom', retry_delay=0)
+    assert not os.path.exists(video)
+
+def test_cleanup_video_is_deleted_when_lease_expires_for_good(queue, video):
+    queue.enqueue('counter', video, {'cleanup': True}, max_attempts=1)
+    queue.lease('w1', lease_seconds=-1)
+    queue.lease('w2')
+    assert not os.path.exists(video)
+
+def test_shared_video_is_kept_until_its_last_job_finishes(queue, video):
+    first = queue.enqueue('counter', video, {'cleanup': True, 'start': 0, 'end': 10})
+    second = queue.enqueue('counter', video, {'cleanup': True, 'start': 20, 'end': 30})
+    queue.lease('w1')
+    queue.complete(first, 'w1', {})
+    assert os.path.exists(video)
+    queue.lease('w1')
+    queue.complete(second, 'w1', {})
+    assert not os.path.exists(video)
+
+def test_enqueue_many_queues_jobs_together(queue, video):
+    ids = queue.enqueue_many([('counter', video, {'cleanup': True, 'start': 0, 'end': 10}),
+                              ('counter', video, {'cleanup': True, 'start': 20, 'end': 30})], priority=2)
+    assert [queue.get(job_id)['status'] for job_id in ids] == [QUEUED, QUEUED]
+    assert queue.get(ids[1])['priority'] == 2
+    queue.lease('w1')
+    queue.complete(ids[0], 'w1', {})
+    assert os.path.exists(video)
+
+def test_enqueue_many_is_all_or_nothing(queue):
+    with pytest.raises(TypeError):
+        queue.enqueue_many([('counter', 'a.mp4', None), ('counter', 'b.mp4', {'start': object()})])
+    assert queue.counts() == {}
+
+def test_video_without_cleanup_is_kept(queue, video):
+    job_id = queue.enqueue('counter', video)
+    queue.lease('w1')
+    queue.complete(job_id, 'w1', {})
+    assert os.path.exists(video)
+
+def test_counts_by_status(queue):
+    queue.enqueue('counter', 'a.mp4')
+    queue.enqueue('counter', 'b.mp4')
+    queue.lease('w1')
+    assert queue.counts() == {QUEUED: 1, RUNNING: 1}
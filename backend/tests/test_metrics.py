@@ -0,0 +1,18 @@
+import metrics
+import stages
+
+def test_render_includes_registered_metrics():
+    metrics.ocr_calls.inc('plate')
+    text = metrics.render()
+    assert 'sentinel_ocr_calls_total{analyzer="plate"}' in text
+
+def test_render_without_resource_module(monkeypatch):
+    # Windows has no resource module
+    monkeypatch.setattr(metrics, 'resource', None)
+    assert 'sentinel_ocr_calls_total' in metrics.render()
+
+def test_cancelled_job_is_not_counted():
+    timer = stages.StageTimer('mask')
+    active = metrics.active_jobs.values.get(('mask',), 0)
+    timer.cancel()
+    assert metrics.active_jobs.values.get(('mask',), 0) == active
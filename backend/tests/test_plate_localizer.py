@@ -0,0 +1,79 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+
+from plate_localizer import PlateModelLocalizer, _search_band, _to_crop, localize_plate
+
+def vehicle(width, height, plate):
+    """Grey crop with dark characters on a white plate at plate = (x1, y1, x2, y2)"""
+    img = np.full((height, width, 3), 90, np.uint8)
+    x1, y1, x2, y2 = plate
+    cv2.rectangle(img, (x1, y1), (x2, y2), (255, 255, 255), -1)
+    scale = (y2 - y1) / 30
+    cv2.putText(img, 'AB123', (x1 + int(5 * scale), y2 - int(5 * scale)), cv2.FONT_HERSHEY_SIMPLEX,
+                0.8 * scale, (0, 0, 0), max(1, int(2 * scale)))
+    return img
+
+class FakeDetector:
+    def __init__(self, results):
+        self.results = results
+        self.frames = None
+
+    def detect_batch(self, frames, classes=None):
+        self.frames = frames
+        return self.results
+
+@pytest.mark.parametrize('rect, top, scale, shape, expected', [
+    ((10, 5, 40, 10), 0, 1.0, (100, 200), (10, 5, 40, 10)),
+    ((10, 5, 40, 10), 35, 1.0, (100, 200), (10, 40, 40, 10)),
+    ((10, 5, 40, 10), 35, 0.5, (100, 200), (20, 45, 80, 20)),
+    # Fractional model boxes round outwards
+    ((10.4, 5.6, 20.2, 3.1), 0, 0.5, (100, 200), (20, 11, 42, 7)),
+    # Boxes past the crop are clipped to it
+    ((-3, 0, 120, 80), 35, 1.0, (100, 100), (0, 35, 100, 65)),
+])
+def test_to_crop(rect, top, scale, shape, expected):
+    assert _to_crop(rect, top, scale, shape) == expected
+
+@pytest.mark.parametrize('width, height, plate', [
+    (400, 200, (150, 130, 270, 160)),
+    # Wider than the search band, so the band is downscaled
+    (800, 400, (300, 260, 540, 320)),
+])
+def test_localize_plate_maps_to_crop(width, height, plate):
+    img = vehicle(width, height, plate)
+    plate_img, (x, y, w, h) = localize_plate(img)
+    x1, y1, x2, y2 = plate
+    assert x1 <= x and x + w <= x2 + 1
+    assert y1 <= y and y + h <= y2 + 1
+    assert w > (x2 - x1) / 2
+    assert np.array_equal(plate_img, img[y:y+h, x:x+w])
+
+def test_localize_plate_without_plate():
+    assert localize_plate(np.full((200, 400, 3), 90, np.uint8)) == (None, None)
+
+def test_model_localizer_maps_boxes_to_crops():
+    wide = np.random.default_rng(0).integers(0, 255, (200, 640, 3), dtype=np.uint8)
+    small = np.random.default_rng(1).integers(0, 255, (100, 200, 3), dtype=np.uint8)
+    empty = np.zeros((100, 200, 3), np.uint8)
+    detector = FakeDetector([
+        np.array([[0, 0, 5, 5, 0.5, 0], [10, 5, 50, 15, 0.9, 0]], np.float32),
+        np.array([[10, 5, 50, 15, 0.9, 0], [20, 20, 60, 30, 0.1, 0]], np.float32),
+        np.zeros((0, 6), np.float32),
+    ])
+    localizer = PlateModelLocalizer(detector)
+    located = localizer.localize_batch([wide, small, empty])
+
+    # The model sees the lower, downscaled band of each crop
+    assert [f.shape for f in detector.frames] == [_search_band(img)[0].shape for img in (wide, small, empty)]
+    assert detector.frames[0].shape == (65, 320, 3)
+
+    # Wide crop: the most confident box wins; the band starts at row 70 and is scaled by 0.5
+    plate_img, rect = located[0]
+    assert rect == (20, 80, 80, 20)
+    assert np.array_equal(plate_img, wide[80:100, 20:100])
+    # Small crop: band starts at row 35 at full size; low-confidence boxes are ignored
+    assert located[1][1] == (10, 40, 40, 10)
+    assert np.array_equal(located[1][0], small[40:50, 10:50])
+    assert located[2] == (None, None)
@@ -0,0 +1,45 @@
+import csv
+import os
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+from plate_store import PlateCropStore
+
+def crop(value=0):
+    return np.full((10, 30, 3), value, np.uint8)
+
+def jpgs(directory):
+    return sorted(f for f in os.listdir(directory) if f.endswith('.jpg'))
+
+def test_keeps_best_k_crops_and_spills_the_rest(tmp_path):
+    store = PlateCropStore(str(tmp_path), best_k=2)
+    for confidence in (0.6, 0.9, 0.7, 0.8):
+        store.add('AB123', confidence, confidence * 10, crop())
+    assert [c[0] for c in store.best['AB123']] == [0.9, 0.8]
+    assert store.spilled == 2
+    assert len(jpgs(str(tmp_path))) == 2
+
+def test_evicts_least_recently_seen_plate(tmp_path):
+    store = PlateCropStore(str(tmp_path), best_k=3, max_plates=2)
+    store.add('ONE', 0.9, 1.0, crop())
+    store.add('TWO', 0.9, 2.0, crop())
+    store.add('ONE', 0.8, 3.0, crop())
+    store.add('THREE', 0.9, 4.0, crop())
+    assert list(store.best) == ['ONE', 'THREE']
+    assert store.spilled == 1
+    assert jpgs(str(tmp_path))[0].startswith('TWO_')
+
+def test_logs_every_detection_and_flush_spills_all(tmp_path):
+    store = PlateCropStore(str(tmp_path), best_k=1)
+    store.add('0123', 0.5, 1.0, crop())
+    store.add('0123', 0.6, 2.0, crop())
+    store.flush()
+    assert store.detections == 2
+    assert not store.best
+    assert len(jpgs(str(tmp_path))) == 2
+    with open(store.log_path, newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == PlateCropStore.LOG_FIELDS
+    assert [r[0] for r in rows[1:]] == ['0123', '0123']
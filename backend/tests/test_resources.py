@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip('cv2')
+
+from resources import allocate
+
+@pytest.mark.parametrize('cores, weights, expected', [
+    (list(range(4)), [], []),
+    (list(range(4)), [1], [[0, 1, 2, 3]]),
+    (list(range(4)), [1, 1], [[0, 1], [2, 3]]),
+    # Fewer cores than jobs: one core each, shared round-robin
+    ([0, 1], [1, 1, 2], [[0], [1], [0]]),
+    ([0, 1, 2], [1, 1, 1], [[0], [1], [2]]),
+    # Rounding: the leftover core goes to the largest remainder, ties to the first job
+    (list(range(4)), [1, 1, 1], [[0, 1], [2], [3]]),
+    (list(range(8)), [1, 2, 1], [[0, 1], [2, 3, 4, 5], [6, 7]]),
+    # Plate jobs (weight 2) get twice the spare cores of the others
+    (list(range(6)), [1, 2], [[0, 1], [2, 3, 4, 5]]),
+    # Shares are of the spare cores, after the one core every job gets
+    (list(range(7)), [2, 1], [[0, 1, 2, 3], [4, 5, 6]]),
+    (list(range(16)), [1, 1, 2], [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11, 12, 13, 14, 15]]),
+    # Core ids need not be contiguous
+    ([2, 3, 6, 7], [1, 1], [[2, 3], [6, 7]]),
+])
+def test_allocate(cores, weights, expected):
+    assert allocate(cores, weights) == expected
+
+@pytest.mark.parametrize('cores', [2, 3, 5, 8, 13, 64])
+@pytest.mark.parametrize('weights', [[1], [2], [1, 2], [2, 1, 1], [1, 1, 1, 1, 2]])
+def test_allocate_uses_every_core_once(cores, weights):
+    budgets = allocate(list(range(cores)), weights)
+    assert len(budgets) == len(weights)
+    assert all(budgets)
+    if len(weights) < cores:
+        assert sorted(c for budget in budgets for c in budget) == list(range(cores))
@@ -0,0 +1,56 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from roi import ROI, to_frame, detect_in_roi, parse_roi
+
+class FakeDetector:
+    """Returns fixed crop-space detections and records the frame it saw"""
+    def __init__(self, detections):
+        self.detections = np.array(detections, np.float32).reshape(-1, 6)
+        self.seen = None
+
+    def detect(self, frame, classes=None):
+        self.seen = frame
+        return self.detections
+
+def test_to_frame_shifts_boxes_only():
+    detections = np.array([[10, 20, 30, 40, 0.9, 0]], np.float32)
+    mapped = to_frame(detections, (100, 50))
+    assert mapped.tolist() == [[110, 70, 130, 90, pytest.approx(0.9), 0]]
+    # The input is left untouched
+    assert detections[0, 0] == 10
+
+def test_to_frame_without_offset_or_detections():
+    empty = np.zeros((0, 6), np.float32)
+    assert to_frame(empty, (5, 5)) is empty
+    detections = np.ones((1, 6), np.float32)
+    assert to_frame(detections, (0, 0)) is detections
+
+def test_detect_in_roi_maps_crop_to_frame():
+    frame = np.zeros((480, 640, 3), np.uint8)
+    detector = FakeDetector([[0, 0, 10, 10, 0.5, 0]])
+    detections = detect_in_roi(detector, frame, ROI(100, 200, 300, 400))
+    assert detector.seen.shape == (200, 200, 3)
+    assert detections[0, :4].tolist() == [100, 200, 110, 210]
+
+def test_detect_in_roi_clips_to_frame():
+    frame = np.zeros((100, 100, 3), np.uint8)
+    detector = FakeDetector([[1, 1, 2, 2, 0.5, 0]])
+    detections = detect_in_roi(detector, frame, ROI(-20, 50, 80, 150))
+    assert detector.seen.shape == (50, 80, 3)
+    assert detections[0, :4].tolist() == [1, 51, 2, 52]
+
+def test_from_zones_with_margin():
+    roi = ROI.from_zones([[(10, 10), (50, 20)], [(30, 40), (60, 15)]], margin=(1, 2, 3, 4))
+    assert roi.as_tuple() == (9, 8, 63, 44)
+
+def test_parse_roi_formats():
+    assert parse_roi('full') is None
+    assert parse_roi('') is None
+    assert parse_roi('1,2,30,40').as_tuple() == (1, 2, 30, 40)
+    assert parse_roi('[[0, 0], [10, 5]]', margin=1).as_tuple() == (-1, -1, 11, 6)
+
+def test_parse_roi_rejects_empty_region():
+    with pytest.raises(ValueError):
+        parse_roi('10,10,5,20')
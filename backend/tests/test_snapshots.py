@@ -0,0 +1,34 @@
+import threading
+import time
+from snapshots import SnapshotStore
+
+def test_publish_bumps_version_and_keeps_old_snapshots():
+    store = SnapshotStore({'count': 0})
+    version, before = store.snapshot()
+    assert store.publish(count=1) == version + 1
+    assert before['count'] == 0
+    assert store.get()['count'] == 1
+
+def test_json_is_cached_per_version():
+    store = SnapshotStore({'count': 0})
+    version, body = store.json()
+    assert store.json()[1] is body
+    store.publish(count=2)
+    new_version, new_body = store.json()
+    assert new_version == version + 1
+    assert new_body == b'{"count": 2}'
+
+def test_wait_returns_on_publish():
+    store = SnapshotStore({'count': 0})
+    version = store.version
+    threading.Timer(0.05, store.publish, kwargs={'count': 1}).start()
+    started = time.time()
+    assert store.wait(version, timeout=5) == version + 1
+    assert time.time() - started < 4
+
+def test_wait_times_out_without_publish():
+    store = SnapshotStore({'count': 0})
+    assert store.wait(store.version, timeout=0.01) == store.version
+
+def test_epochs_differ_between_stores():
+    assert SnapshotStore({}).epoch != SnapshotStore({}).epoch
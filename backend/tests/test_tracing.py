@@ -0,0 +1,29 @@
+import os
+import pytest
+import stages
+import tracing
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # Traces are written below the results folder in the working directory
+    monkeypatch.chdir(tmp_path)
+
+def test_trace_is_written_when_job_finishes():
+    timer = stages.StageTimer('counter')
+    path = tracing.trace_job(timer.job_id)
+    timer.start()
+    with timer('decode'):
+        pass
+    timer.finish()
+    assert os.path.exists(path)
+    assert timer.job_id not in tracing._recorders
+    assert tracing._on_stage not in stages._listeners
+
+def test_cancelled_job_drops_its_recorder():
+    timer = stages.StageTimer('mask')
+    path = tracing.trace_job(timer.job_id)
+    timer.cancel()
+    assert not os.path.exists(path)
+    assert timer.job_id not in tracing._recorders
+    assert tracing._on_stage not in stages._listeners
+    assert tracing._on_job not in stages._job_listeners
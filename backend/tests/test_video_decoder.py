@@ -0,0 +1,59 @@
+import json
+import subprocess
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+
+import video_decoder
+from video_decoder import OpenCVDecoder
+
+@pytest.fixture
+def clip(tmp_path):
+    """Five seconds at 10 fps; each frame's brightness is its index"""
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+    for i in range(50):
+        writer.write(np.full((48, 64, 3), i * 5, np.uint8))
+    writer.release()
+    return path
+
+def read_all(decoder):
+    frames = []
+    while True:
+        ok, frame = decoder.read()
+        if not ok:
+            break
+        frames.append((decoder.timestamp, int(round(frame.mean() / 5))))
+    decoder.release()
+    return frames
+
+def test_opencv_step(clip):
+    frames = read_all(OpenCVDecoder(clip, step=5))
+    assert [index for _, index in frames] == list(range(0, 50, 5))
+
+def test_opencv_keyframes_only_samples_once_a_second(clip):
+    frames = read_all(OpenCVDecoder(clip, keyframes_only=True))
+    assert [t for t, _ in frames] == pytest.approx([0, 1, 2, 3, 4])
+    assert [index for _, index in frames] == [0, 10, 20, 30, 40]
+
+@pytest.mark.parametrize('stream, format, frame_count, duration', [
+    ({'nb_frames': '50', 'duration': '5.000000'}, {'duration': '5.000000'}, 50, 5.0),
+    # Containers without a frame count in the header (mkv, streams)
+    ({'nb_frames': 'N/A'}, {'duration': '4.000000'}, 40, 4.0),
+    ({}, {}, 0, 0.0),
+])
+def test_ffprobe_frame_count_without_packet_count(monkeypatch, stream, format, frame_count, duration):
+    info = {'streams': [dict(width=64, height=48, avg_frame_rate='10/1', **stream)], 'format': format}
+    calls = []
+
+    def run(args, **kwargs):
+        calls.append(args)
+        return subprocess.CompletedProcess(args, 0, json.dumps(info).encode())
+    monkeypatch.setattr(video_decoder, 'ffmpeg_available', lambda: True)
+    monkeypatch.setattr(video_decoder.subprocess, 'run', run)
+    result = video_decoder.probe('clip.mkv')
+    assert '-count_packets' not in calls[0]
+    assert result['frame_count'] == frame_count
+    assert result['duration'] == duration
+    assert result['fps'] == 10.0
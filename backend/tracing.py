@@ -0,0 +1,170 @@
+"""
+On-demand timeline traces of single analyzer jobs.
+
+A traced job records a span for every pipeline stage, per frame and per thread,
+and can sample Python stacks of the job thread. The result is written in the
+Chrome trace event format (open in chrome://tracing or ui.perfetto.dev).
+Nothing is hooked into the pipeline while no job is being traced.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import stages
+
+_recorders = {}
+_lock = threading.Lock()
+
+class TraceRecorder:
+    """Collects trace events for one job and writes them when the job ends"""
+    def __init__(self, job_id, path, sample_interval=None):
+        self.job_id = job_id
+        self.path = path
+        self.sample_interval = sample_interval
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.events = []
+        self.threads = {}
+        self.stack_frames = {}
+        self.samples = []
+        self.job_start = None
+        self.job_thread = None
+        self.job_tid = None
+        self.sampler = None
+        self.sampling = False
+
+    def _ts(self, t):
+        return (t - self.origin) * 1e6
+
+    def _thread(self):
+        tid = threading.get_native_id()
+        if tid not in self.threads:
+            self.threads[tid] = threading.current_thread().name
+        return tid
+
+    def add_span(self, timer, stage, start, end):
+        self.events.append({
+            'name': stage,
+            'cat': timer.analyzer,
+            'ph': 'X',
+            'ts': self._ts(start),
+            'dur': (end - start) * 1e6,
+            'pid': self.pid,
+            'tid': self._thread(),
+            'args': {'frame': timer.frame}
+        })
+
+    def job_started(self, timer):
+        self.job_start = time.perf_counter()
+        self.job_thread = threading.get_ident()
+        self.job_tid = self._thread()
+        if self.sample_interval:
+            self.sampling = True
+            self.sampler = threading.Thread(target=self._sample_loop, daemon=True)
+            self.sampler.start()
+
+    def job_finished(self, timer):
+        end = time.perf_counter()
+        self.sampling = False
+        if self.sampler is not None:
+            self.sampler.join(timeout=1)
+        start = self.job_start if self.job_start is not None else self.origin
+        self.events.append({
+            'name': f"{timer.analyzer} job",
+            'cat': timer.analyzer,
+            'ph': 'X',
+            'ts': self._ts(start),
+            'dur': (end - start) * 1e6,
+            'pid': self.pid,
+            'tid': self._thread(),
+            'args': {'job_id': self.job_id, 'frames': timer.frame}
+        })
+        self.write()
+
+    def _stack_id(self, frame):
+        """Intern a Python stack as chained stackFrames entries"""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        parent = None
+        for name in reversed(stack):
+            key = f"{parent}/{name}"
+            entry = self.stack_frames.get(key)
+            if entry is None:
+                entry = {'id': str(len(self.stack_frames)), 'name': name, 'category': 'python'}
+                if parent is not None:
+                    entry['parent'] = parent
+                self.stack_frames[key] = entry
+            parent = entry['id']
+        return parent
+
+    def _sample_loop(self):
+        while self.sampling:
+            frame = sys._current_frames().get(self.job_thread)
+            if frame is not None:
+                self.samples.append({
+                    'cpu': 0,
+                    'tid': self.job_tid,
+                    'ts': self._ts(time.perf_counter()),
+                    'name': 'sample',
+                    'sf': self._stack_id(frame),
+                    'weight': 1
+                })
+            time.sleep(self.sample_interval)
+
+    def write(self):
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                    for tid, name in self.threads.items()]
+        trace = {
+            'traceEvents': metadata + self.events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'job_id': self.job_id}
+        }
+        if self.samples:
+            trace['stackFrames'] = {e['id']: {k: v for k, v in e.items() if k != 'id'}
+                                    for e in self.stack_frames.values()}
+            trace['samples'] = self.samples
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.path, 'w') as f:
+            json.dump(trace, f)
+        print(f"Trace for job {self.job_id} saved to {self.path}")
+
+def _on_stage(timer, stage, start, end):
+    recorder = _recorders.get(timer.job_id)
+    if recorder is not None:
+        recorder.add_span(timer, stage, start, end)
+
+def _on_job(timer, event):
+    recorder = _recorders.get(timer.job_id)
+    if recorder is None:
+        return
+    if event == 'start':
+        recorder.job_started(timer)
+        return
+    with _lock:
+        _recorders.pop(timer.job_id, None)
+        if not _recorders:
+            stages.remove_listener(_on_stage)
+            stages.remove_job_listener(_on_job)
+    if event == 'end':
+        recorder.job_finished(timer)
+
+def trace_path(job_id):
+    return os.path.join(stages.results_dir(job_id, create=False), 'trace.json')
+
+def trace_job(job_id, sample_interval=None):
+    """
+    Record a trace of the job with this id. sample_interval (seconds) enables
+    sampling of the job thread's Python stack. Returns the trace file path.
+    """
+    recorder = TraceRecorder(job_id, trace_path(job_id), sample_interval)
+    with _lock:
+        _recorders[job_id] = recorder
+        stages.add_listener(_on_stage)
+        stages.add_job_listener(_on_job)
+    return recorder.path
@@ -0,0 +1,64 @@
+import numpy as np
+
+class TrackStore:
+    """
+    Compact per-track state kept in parallel NumPy arrays.
+
+    Each live track has a last known center, the frame it was last seen on and
+    a bit field of flags. Tracks not seen for more than ttl frames are evicted,
+    so memory depends on how many people are in view, not on stream length.
+    """
+    def __init__(self, capacity=64, ttl=50):
+        self.ttl = ttl
+        self.ids = np.full(capacity, -1, np.int64)
+        self.centers = np.zeros((capacity, 2), np.int32)
+        self.last_seen = np.zeros(capacity, np.int64)
+        self.flags = np.zeros(capacity, np.uint8)
+        self.slots = {}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, track_id):
+        return track_id in self.slots
+
+    def _grow(self):
+        capacity = len(self.ids)
+        self.ids = np.concatenate([self.ids, np.full(capacity, -1, np.int64)])
+        self.centers = np.concatenate([self.centers, np.zeros((capacity, 2), np.int32)])
+        self.last_seen = np.concatenate([self.last_seen, np.zeros(capacity, np.int64)])
+        self.flags = np.concatenate([self.flags, np.zeros(capacity, np.uint8)])
+
+    def touch(self, track_id, center, frame):
+        """Record that a track was seen at center on frame, adding it if new"""
+        slot = self.slots.get(track_id)
+        if slot is None:
+            free = np.flatnonzero(self.ids < 0)
+            if len(free) == 0:
+                self._grow()
+                free = np.flatnonzero(self.ids < 0)
+            slot = int(free[0])
+            self.slots[track_id] = slot
+            self.ids[slot] = track_id
+            self.flags[slot] = 0
+        self.centers[slot] = center
+        self.last_seen[slot] = frame
+        return slot
+
+    def set_flag(self, track_id, flag):
+        slot = self.slots.get(track_id)
+        if slot is not None:
+            self.flags[slot] |= flag
+
+    def has_flag(self, track_id, flag):
+        slot = self.slots.get(track_id)
+        return slot is not None and bool(self.flags[slot] & flag)
+
+    def evict(self, frame):
+        """Drop tracks not seen for more than ttl frames; return their (id, flags)"""
+        stale = np.flatnonzero((self.ids >= 0) & (frame - self.last_seen > self.ttl))
+        evicted = [(int(self.ids[slot]), int(self.flags[slot])) for slot in stale]
+        for track_id, _ in evicted:
+            del self.slots[track_id]
+        self.ids[stale] = -1
+        return evicted
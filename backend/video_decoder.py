@@ -0,0 +1,253 @@
+"""
+Video decoding for the analyzers.
+
+FFmpegDecoder reads raw BGR frames from an ffmpeg subprocess pipe, letting
+ffmpeg do the scaling, frame stepping, frame-rate reduction, seeking and
+keyframe-only decoding, and reads each frame into a small pool of reusable
+NumPy buffers. OpenCVDecoder offers the same interface on cv2.VideoCapture for
+machines without ffmpeg. Both return (ok, frame) from read() like VideoCapture.
+
+Frames from FFmpegDecoder, and any crops sliced from them, are overwritten a
+few reads later. Analyzers only use them until the next read; anything that
+keeps image data longer (the plate crop store, the export queue) copies it.
+"""
+import json
+import os
+import shutil
+import subprocess
+import cv2
+import numpy as np
+
+FFMPEG = os.environ.get('SENTINEL_FFMPEG', 'ffmpeg')
+FFPROBE = os.environ.get('SENTINEL_FFPROBE', 'ffprobe')
+
+# 'ffmpeg', 'opencv' or 'auto' (ffmpeg when installed)
+DECODER_BACKEND = os.environ.get('SENTINEL_DECODER', 'auto')
+
+def ffmpeg_available():
+    return shutil.which(FFMPEG) is not None and shutil.which(FFPROBE) is not None
+
+def _number(value):
+    """ffprobe field as a float; missing and 'N/A' fields are 0"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def probe(path):
+    """Return width, height, fps, frame_count and duration of a video, or None if unreadable"""
+    if ffmpeg_available():
+        try:
+            out = subprocess.run(
+                [FFPROBE, '-v', 'error', '-select_streams', 'v:0',
+                 '-show_entries', 'stream=width,height,avg_frame_rate,nb_frames,duration:format=duration',
+                 '-of', 'json', path],
+                capture_output=True, check=True).stdout
+            info = json.loads(out)
+            stream = info['streams'][0]
+        except (subprocess.CalledProcessError, ValueError, KeyError, IndexError):
+            return None
+        num, den = (int(v) for v in stream.get('avg_frame_rate', '0/1').split('/'))
+        fps = num / den if den else 0.0
+        duration = _number(info.get('format', {}).get('duration')) or _number(stream.get('duration'))
+        # nb_frames comes from the container header; counting packets would read the whole file
+        frame_count = int(_number(stream.get('nb_frames')) or round(duration * fps))
+        return {
+            'width': int(stream['width']),
+            'height': int(stream['height']),
+            'fps': fps,
+            'frame_count': frame_count,
+            'duration': duration
+        }
+
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        return {
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': fps,
+            'frame_count': frame_count,
+            'duration': frame_count / fps if fps else 0.0
+        }
+    finally:
+        cap.release()
+
+def keyframe_times(path, start=None, end=None):
+    """Presentation times (seconds) of the keyframes of a video"""
+    out = subprocess.run(
+        [FFPROBE, '-v', 'error', '-select_streams', 'v:0', '-skip_frame', 'nokey',
+         '-show_entries', 'frame=pts_time', '-of', 'csv=p=0', path],
+        capture_output=True, check=True).stdout.decode()
+    times = [float(t) for t in out.split() if t and t != 'N/A']
+    return [t for t in times if (start is None or t >= start) and (end is None or t < end)]
+
+class _Decoder:
+    """Shared bookkeeping: source geometry, output size and frame timestamps"""
+    def __init__(self, path, size=None, step=1, fps=None, start=None, end=None):
+        self.path = path
+        self.info = probe(path) or {'width': 0, 'height': 0, 'fps': 0.0, 'frame_count': 0, 'duration': 0.0}
+        self.source_fps = self.info['fps'] or 25.0
+        self.step = max(1, int(step))
+        self.out_fps = fps
+        self.start = start or 0.0
+        self.end = end
+        self.size = tuple(size) if size else (self.info['width'], self.info['height'])
+        self.count = 0
+        self.timestamp = None
+        self.frame_index = None
+
+    @property
+    def fps(self):
+        """Rate of the frames returned by read()"""
+        if self.out_fps:
+            return float(self.out_fps)
+        return self.source_fps / self.step
+
+    @property
+    def frame_count(self):
+        """Expected number of frames returned by read()"""
+        duration = (self.end or self.info['duration'] or self.info['frame_count'] / self.source_fps) - self.start
+        return max(0, int(duration * self.fps))
+
+    def _advance(self, timestamp):
+        self.timestamp = timestamp
+        self.frame_index = int(round(timestamp * self.source_fps))
+        self.count += 1
+
+class FFmpegDecoder(_Decoder):
+    """Decoder reading frames from an ffmpeg subprocess into reusable buffers"""
+    def __init__(self, path, size=None, step=1, fps=None, start=None, end=None,
+                 keyframes_only=False, buffers=4, threads=None):
+        super().__init__(path, size, step, fps, start, end)
+        self.proc = None
+        if not self.info['width']:
+            print(f"Error: Could not open video file {path}")
+            return
+        self.keyframes_only = keyframes_only
+        self.keyframes = keyframe_times(path, start, end) if keyframes_only else None
+
+        width, height = self.size
+        self.frame_bytes = width * height * 3
+        self.buffers = [np.empty((height, width, 3), np.uint8) for _ in range(max(1, buffers))]
+
+        cmd = [FFMPEG, '-v', 'error', '-nostdin']
+        if threads:
+            cmd += ['-threads', str(threads)]
+        if keyframes_only:
+            cmd += ['-skip_frame', 'nokey']
+        if start:
+            cmd += ['-ss', f"{start:.3f}"]
+        cmd += ['-i', path]
+        if end is not None:
+            cmd += ['-t', f"{end - self.start:.3f}"]
+
+        filters = []
+        if self.step > 1 and not keyframes_only:
+            filters.append(f"select=not(mod(n\\,{self.step}))")
+        if fps and not keyframes_only:
+            filters.append(f"fps={fps}")
+        if self.size != (self.info['width'], self.info['height']):
+            filters.append(f"scale={width}:{height}")
+        if filters:
+            cmd += ['-vf', ','.join(filters)]
+        cmd += ['-vsync', '0', '-an', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     bufsize=self.frame_bytes)
+
+    def isOpened(self):
+        return self.proc is not None
+
+    def read(self):
+        """
+        Return (ok, frame). The frame buffer is reused after len(buffers) more
+        reads, so callers that keep frames longer must copy them.
+        """
+        if self.proc is None:
+            return False, None
+        frame = self.buffers[self.count % len(self.buffers)]
+        view = memoryview(frame).cast('B')
+        filled = 0
+        while filled < self.frame_bytes:
+            n = self.proc.stdout.readinto(view[filled:])
+            if not n:
+                return False, None
+            filled += n
+
+        if self.keyframes is not None:
+            timestamp = self.keyframes[self.count] if self.count < len(self.keyframes) else None
+        elif self.out_fps:
+            timestamp = self.start + self.count / float(self.out_fps)
+        else:
+            timestamp = self.start + self.count * self.step / self.source_fps
+        if timestamp is None:
+            timestamp = self.start + self.count / self.fps
+        self._advance(timestamp)
+        return True, frame
+
+    def release(self):
+        if self.proc is not None:
+            self.proc.stdout.close()
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+class OpenCVDecoder(_Decoder):
+    """Same interface on cv2.VideoCapture (stepping uses grab(), scaling cv2.resize)"""
+    def __init__(self, path, size=None, step=1, fps=None, start=None, end=None,
+                 keyframes_only=False, **_):
+        super().__init__(path, size, step, fps, start, end)
+        self.cap = cv2.VideoCapture(path)
+        if start:
+            self.cap.set(cv2.CAP_PROP_POS_MSEC, start * 1000)
+        if fps:
+            self.step = max(1, int(round(self.source_fps / fps)))
+            self.out_fps = None
+        # OpenCV cannot skip to keyframes; sample about one frame per second instead,
+        # seeking between samples rather than grabbing every frame in between
+        self.seek = keyframes_only and not fps
+        if self.seek:
+            self.step = max(self.step, int(round(self.source_fps)))
+        self.native_size = (self.info['width'], self.info['height'])
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        position = self.cap.get(cv2.CAP_PROP_POS_FRAMES) / self.source_fps
+        if self.end is not None and position >= self.end:
+            return False, None
+        ret, frame = self.cap.read()
+        if not ret:
+            return False, None
+        if self.seek:
+            self.cap.set(cv2.CAP_PROP_POS_MSEC, (position + self.step / self.source_fps) * 1000)
+        else:
+            for _ in range(self.step - 1):
+                if not self.cap.grab():
+                    break
+        if self.size != self.native_size:
+            frame = cv2.resize(frame, self.size)
+        self._advance(position)
+        return True, frame
+
+    def release(self):
+        self.cap.release()
+
+def open_video(path, backend=None, **options):
+    """
+    Open a video for analysis. Options: size=(w, h), step=N (every Nth frame),
+    fps=N, start/end (seconds), keyframes_only, buffers.
+    """
+    backend = backend or DECODER_BACKEND
+    if backend == 'auto':
+        backend = 'ffmpeg' if ffmpeg_available() else 'opencv'
+    if backend == 'ffmpeg':
+        return FFmpegDecoder(path, **options)
+    if backend == 'opencv':
+        return OpenCVDecoder(path, **options)
+    raise ValueError(f"Unknown decoder backend: {backend}")
@@ -0,0 +1,87 @@
+"""
+Annotated video export.
+
+Analyzers hand annotated frames to a BackgroundEncoder, which writes them to
+the job's results directory from its own thread. The hand-off queue is bounded:
+when the encoder falls behind, the analyzer waits for it, so the exported video
+has every frame. Frames are only dropped (and counted) if the encoder stalls
+for longer than EXPORT_PUT_TIMEOUT.
+"""
+import os
+import queue
+import threading
+import cv2
+import metrics
+from stages import results_dir
+
+EXPORT_FILENAME = 'annotated.mp4'
+
+# Frames waiting for the encoder; about two seconds of 30 fps video
+EXPORT_QUEUE_SIZE = int(os.environ.get('SENTINEL_EXPORT_QUEUE', '64'))
+
+# Seconds an analyzer waits for room in the queue before dropping a frame
+EXPORT_PUT_TIMEOUT = float(os.environ.get('SENTINEL_EXPORT_PUT_TIMEOUT', '5'))
+
+# 'mp4v' is available in every OpenCV build; 'avc1' needs an H.264-enabled one
+EXPORT_FOURCC = os.environ.get('SENTINEL_EXPORT_FOURCC', 'mp4v')
+
+def export_path(job_id):
+    return os.path.join(results_dir(job_id), EXPORT_FILENAME)
+
+class BackgroundEncoder:
+    """Writes frames to a video file on a background thread"""
+    def __init__(self, path, fps, analyzer='export', queue_size=EXPORT_QUEUE_SIZE, fourcc=EXPORT_FOURCC,
+                 put_timeout=EXPORT_PUT_TIMEOUT):
+        self.path = path
+        self.fps = fps or 25.0
+        self.analyzer = analyzer
+        self.fourcc = fourcc
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.put_timeout = put_timeout
+        self.writer = None
+        self.written = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, frame):
+        """Queue a frame for encoding, waiting while the queue is full; returns False if it was dropped"""
+        try:
+            # Copy, since decoders and analyzers reuse their frame buffers
+            self.queue.put(frame.copy(), timeout=self.put_timeout)
+        except queue.Full:
+            self.dropped += 1
+            metrics.export_frames_dropped.inc(self.analyzer)
+            return False
+        metrics.queue_depth.set(self.queue.qsize(), 'export')
+        return True
+
+    def _run(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            if self.writer is None:
+                height, width = frame.shape[:2]
+                self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc),
+                                              self.fps, (width, height))
+            self.writer.write(frame)
+            self.written += 1
+            metrics.export_frames.inc(self.analyzer)
+            metrics.queue_depth.set(self.queue.qsize(), 'export')
+
+    def close(self):
+        """Finish writing the queued frames and close the file; returns its path"""
+        # The end marker must not be dropped, so this put may wait for the encoder
+        self.queue.put(None)
+        self.thread.join()
+        if self.writer is not None:
+            self.writer.release()
+        metrics.queue_depth.set(0, 'export')
+        if self.dropped:
+            print(f"Export {self.path}: {self.dropped} frames dropped, {self.written} written")
+        return self.path if self.written else None
+
+def open_export(job_id, fps, analyzer):
+    """Start exporting a job's annotated video"""
+    return BackgroundEncoder(export_path(job_id), fps, analyzer)